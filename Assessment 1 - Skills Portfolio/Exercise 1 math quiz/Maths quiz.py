@@ -1,6 +1,8 @@
 # importing required modules
 import tkinter as tk
 from tkinter import ttk, messagebox
+import json
+import os
 import random
 
 # setting up colours for the UI
@@ -11,6 +13,15 @@ TITLE_COLOR = "#2C2C54"
 TEXT_COLOR = "#333"
 FRAME_COLOR = "#ffffff"
 
+# the questions are made ahead of time and kept in this file, so every quiz is
+# just the next 10 from the bank (see buildBank and nextQuestions)
+BANK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_bank.json")
+# the same seed always makes the same questions, so quizzes can be repeated exactly
+BANK_SEED = 2024
+# different questions made for each level (easy only has 126 possible ones, so it gets those)
+BANK_SIZE = 500
+LEVELS = ["easy", "moderate", "advanced"]
+
 # function for showing a small loading animation before menu
 def loading_bar(callback):
     clear_window()
@@ -42,28 +53,88 @@ def displayMenu():
                    command=lambda l=level: start_quiz(l)).pack(pady=10)
 
 # function to generate random numbers based on selected difficulty
-def randomInt(level):
+# (rng is a random.Random when making a seeded question bank)
+def randomInt(level, rng=random):
     if level == "easy":
-        return random.randint(1, 9)
+        return rng.randint(1, 9)
     elif level == "moderate":
-        return random.randint(10, 99)
+        return rng.randint(10, 99)
     elif level == "advanced":
-        return random.randint(1000, 9999)
+        return rng.randint(1000, 9999)
 
 # randomly decide whether question is addition or subtraction
-def decideOperation():
-    return random.choice(["+", "-"])
+def decideOperation(rng=random):
+    return rng.choice(["+", "-"])
+
+# one question with its answer worked out: (num1, operation, num2, answer)
+def makeQuestion(level, rng=random):
+    operation = decideOperation(rng)
+    num1 = randomInt(level, rng)
+    num2 = randomInt(level, rng)
+    # make sure subtraction doesn’t go negative
+    if operation == "-" and num1 < num2:
+        num1, num2 = num2, num1
+    return num1, operation, num2, (num1 + num2 if operation == "+" else num1 - num2)
+
+# make a level's questions ahead of time - no question twice, same seed same questions
+def buildBank(level, seed=BANK_SEED, size=BANK_SIZE):
+    rng = random.Random(f"{seed}-{level}")
+    questions, seen = [], set()
+    tries = 0
+    # stop trying after a while, easy runs out of new questions long before 500
+    while len(questions) < size and tries < size * 50:
+        tries += 1
+        question = makeQuestion(level, rng)
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
+
+# a fresh bank for every level, each with where the next quiz starts
+def newBank(seed=BANK_SEED, size=BANK_SIZE):
+    return {"seed": seed, "size": size,
+            "levels": {level: {"next": 0, "questions": buildBank(level, seed, size)} for level in LEVELS}}
+
+# the next few questions for a level - the bank is used as a ring, so after
+# the last question it goes round to the first one again
+def nextQuestions(level, count=10):
+    entry = bank["levels"][level]
+    questions, start = entry["questions"], entry["next"]
+    entry["next"] = (start + count) % len(questions)
+    return [questions[(start + i) % len(questions)] for i in range(count)]
+
+# save the bank (and where each level is up to) so the next run carries on from there
+def saveBank(path=BANK_FILE):
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(bank, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass # read-only folder, the quiz still works, it just starts from the top next time
+
+# load a saved bank, None if there isn't one, it looks wrong or it was made
+# with a different BANK_SEED or BANK_SIZE (then a new one gets made)
+def loadBank(path=BANK_FILE):
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        if saved["seed"] != BANK_SEED or saved["size"] != BANK_SIZE:
+            return None
+        for level in LEVELS:
+            entry = saved["levels"][level]
+            entry["questions"] = [tuple(q) for q in entry["questions"]]
+            if not entry["questions"] or not 0 <= entry["next"] < len(entry["questions"]):
+                return None
+        return saved
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
 # function to show each maths question
 def displayProblem():
-    global num1, num2, operation, answer_entry, attempt, progress_bar
+    global num1, num2, operation, answer, answer_entry, attempt, progress_bar
     clear_window()
-    operation = decideOperation()
-    num1 = randomInt(difficulty)
-    num2 = randomInt(difficulty)
-    # make sure subtraction doesn’t go negative
-    if operation == "-" and num1 < num2:
-        num1, num2 = num2, num1
+    # already made, see nextQuestions
+    num1, operation, num2, answer = questions[question_number - 1]
     attempt = 1
 
     tk.Label(root, text="🧮 Maths Quiz", font=("Arial", 20, "bold"),
@@ -91,7 +162,7 @@ def displayProblem():
 
 # check if user’s answer is correct
 def isCorrect(user_answer):
-    return user_answer == (num1 + num2 if operation == "+" else num1 - num2)
+    return user_answer == answer
 
 # small visual effect for correct/wrong answers
 def flash_color(color):
@@ -166,17 +237,25 @@ def displayResults():
 
 # starts the quiz and resets score
 def start_quiz(level):
-    global difficulty, score, question_number
+    global difficulty, score, question_number, questions
     difficulty = level
     score = 0
     question_number = 1
+    questions = nextQuestions(level)
     displayProblem()
+    root.after_idle(saveBank) # once the first question is up
 
 
 def clear_window():
     for widget in root.winfo_children():
         widget.destroy()
 
+# load the question bank, or make one the first time
+bank = loadBank()
+if bank is None:
+    bank = newBank()
+    saveBank()
+
 # creating main window
 root = tk.Tk()
 root.title("🎲 Maths Quiz")
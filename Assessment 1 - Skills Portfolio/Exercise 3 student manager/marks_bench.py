@@ -0,0 +1,154 @@
+# Benchmarks for the student manager's core (marks_core), on made-up marks files:
+#   python marks_bench.py                           10k, 100k and 1M students
+#   python marks_bench.py --rows 10000000 --bad-ratio 0.01 --out bench.jsonl
+# Each size is one JSON line (on stdout, or appended to --out) with the best of
+# --repeat runs for every step, so runs from different versions can be compared.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from marks_core import (MarkStore, class_summary, grade_columns, load_store, read_marks_bin,
+                        write_marks_bin, write_marks_sqlite, write_marks_text)
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+SORT_COLUMNS = ["code", "name", "cw_total", "exam", "pct", "grade"]
+FIRST_NAMES = ["Lee", "Les", "Matt", "Ron", "Sam", "Jo", "John", "Gareth", "Amy", "Priya", "Chen", "Olu",
+               "Fatima", "Kofi", "Ana", "Ivan", "Mei", "Tom", "Zara", "Noah"]
+LAST_NAMES = ["Scott", "Ferdinand", "Thompson", "Herrema", "Sturtivant", "Hyde", "Curry", "Southgate",
+              "Patel", "Wong", "Okafor", "Silva", "Novak", "Smith", "Khan", "Jones", "Garcia", "Ali"]
+# lines written to the file at a time while generating
+GEN_BATCH = 100_000
+# files the save steps write into the work folder
+SAVE_FILES = {"text": "bench_save.txt", "binary": "bench_save.smb", "sqlite": "bench_save.db"}
+
+
+def generate_marks_file(path, rows, bad_ratio=0.0, header=True, seed=0):
+    # Write a studentMarks.txt-style file with `rows` lines, about bad_ratio of them
+    # broken in the ways real files are (missing fields, words for marks). Codes
+    # are all different but in a jumbled order, and the same seed gives the same file.
+    rng = random.Random(seed)
+    # i -> start + i * stride % rows visits every code once when stride and rows share no factors
+    stride = 1_000_003 if rows % 1_000_003 else 999_983
+    with open(path, "w") as f:
+        if header:
+            f.write(f"{rows}\n")
+        for start in range(0, rows, GEN_BATCH):
+            lines = []
+            for i in range(start, min(rows, start + GEN_BATCH)):
+                code = 1000 + i * stride % rows
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                if bad_ratio and rng.random() < bad_ratio:
+                    lines.append(rng.choice([f"{code},{name},12,15\n", f"{code},{name},ten,15,9,50\n",
+                                             f"{name},12,15,9,50,extra,fields\n"]))
+                else:
+                    lines.append(f"{code},{name},{rng.randint(0, 20)},{rng.randint(0, 20)},"
+                                 f"{rng.randint(0, 20)},{rng.randint(0, 100)}\n")
+            f.writelines(lines)
+
+
+def best_of(repeat, fn, setup=None):
+    # fastest of `repeat` runs in seconds (setup isn't timed), plus the last result
+    best, result = None, None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        result = fn(arg) if setup else fn()
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best, result
+
+
+def bench(path, repeat, workdir):
+    # time each step of the core on one file, returns {step: seconds} and a few counts
+    times = {}
+    times["load_text"], (store, _, bad) = best_of(repeat, lambda: load_store(path))
+    counts = {"students": len(store), "bad_lines": bad}
+
+    out = {kind: os.path.join(workdir, name) for kind, name in SAVE_FILES.items()}
+    times["save_text"], _ = best_of(repeat, lambda: write_marks_text(out["text"], store))
+    times["save_binary"], _ = best_of(repeat, lambda: write_marks_bin(out["binary"], store))
+    times["save_sqlite"], _ = best_of(repeat, lambda: write_marks_sqlite(out["sqlite"], store))
+    times["load_binary"], _ = best_of(repeat, lambda: MarkStore().load_columns(*read_marks_bin(out["binary"])))
+    times["load_sqlite"], _ = best_of(repeat, lambda: load_store(out["sqlite"]))
+    times["grade_columns"], _ = best_of(repeat, lambda: grade_columns(store.cw1, store.cw2, store.cw3, store.exam))
+
+    # every sort builds its index from scratch, which is what the first click on a column costs
+    for col in SORT_COLUMNS:
+        times[f"sort_{col}"], _ = best_of(repeat, lambda s: s.sorted_rows(col), setup=lambda: fresh(store))
+
+    # searches: the first one builds the trigram index, the rest are timed on their own
+    times["search_index"], _ = best_of(repeat, lambda s: s.search("scott"), setup=lambda: fresh(store))
+    queries = {"code_prefix": "12", "name_prefix": "jo", "substring": "patel", "fuzzy": "gareth sotgate"}
+    for label, q in queries.items():
+        times[f"search_{label}"], hits = best_of(repeat, lambda: store.search(q))
+        counts[f"search_{label}_hits"] = len(hits)
+
+    times["extremes"], _ = best_of(repeat, lambda s: (s.best(), s.worst()), setup=lambda: fresh(store))
+    times["summary"], _ = best_of(repeat, lambda: class_summary(store))
+    return times, counts
+
+
+def fresh(store):
+    # the same students with no indexes or heaps built yet
+    store.drop_indexes()
+    return store
+
+
+def git_commit():
+    # which version is being measured, None when not in a git checkout
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the student manager on generated marks files.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="file sizes to try")
+    parser.add_argument("--bad-ratio", type=float, default=0.0, help="share of broken lines, e.g. 0.01")
+    parser.add_argument("--no-header", action="store_true", help="leave out the student count line")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per step, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="where to put the generated files (default: a temp folder)")
+    parser.add_argument("--keep-files", action="store_true", help="don't delete the generated files")
+    parser.add_argument("--out", help="append the JSON lines to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="marks_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    meta = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+            "when": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat, "seed": args.seed,
+            "bad_ratio": args.bad_ratio, "header": not args.no_header}
+    for rows in args.rows:
+        path = os.path.join(workdir, f"marks_{rows}.txt")
+        start = time.perf_counter()
+        generate_marks_file(path, rows, args.bad_ratio, not args.no_header, args.seed)
+        print(f"generated {rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        times, counts = bench(path, args.repeat, workdir)
+        line = json.dumps({**meta, "rows": rows, "file_bytes": os.path.getsize(path), **counts,
+                           "seconds": {k: round(v, 6) for k, v in times.items()}})
+        if args.out:
+            with open(args.out, "a") as f:
+                f.write(line + "\n")
+        else:
+            print(line)
+        for step, took in times.items():
+            print(f"  {step:<20} {took * 1000:10.2f} ms", file=sys.stderr)
+        if not args.keep_files:
+            for name in [path] + [os.path.join(workdir, name) for name in SAVE_FILES.values()]:
+                if os.path.exists(name):
+                    os.remove(name)
+    if not args.dir and not args.keep_files:
+        os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# Student manager without the window, for scripts and servers:
+#   python marks_cli.py list studentMarks.txt
+#   python marks_cli.py top studentMarks.txt 10
+#   python marks_cli.py rank studentMarks.txt 8439
+#   python marks_cli.py sort marks.smb pct --desc | head
+#   python marks_cli.py query studentMarks.txt --grade F --max-exam 29 --sort pct --limit 50
+#   python marks_cli.py export studentMarks.txt marks.db
+#   python marks_cli.py report studentMarks.txt grades.csv
+#   python marks_cli.py import from_excel.csv studentMarks.txt --rejects rejected.csv
+#   python marks_cli.py cohort modules/ --workers 8
+# Students come out one per line as code,name,coursework,exam,percent,grade.
+import argparse
+import os
+import sys
+from itertools import islice
+
+from marks_core import (MarkStore, class_summary, cohort_files, import_changes, load_cohort, load_store,
+                        open_backend, read_import_csv, write_rejects, write_report)
+
+# lines written to stdout at a time
+OUT_BATCH = 10000
+SORT_COLUMNS = ["code", "name", "cw_total", "exam", "pct", "grade"]
+# rejected CSV rows listed on stderr when there's no --rejects file
+REJECTS_SHOWN = 20
+
+
+def format_rows(store, rows):
+    codes, names = store.codes, store.names
+    cw_tot, exam, pct, grades = store.cw_tot, store.exam, store.pct, store.grades
+    for rid in rows:
+        yield f"{codes[rid]},{names[rid]},{cw_tot[rid]},{exam[rid]},{pct[rid]},{chr(grades[rid])}\n"
+
+
+def print_rows(store, rows, header=False):
+    # stream the rows out in batches instead of building one huge string
+    out = sys.stdout
+    if header:
+        out.write("code,name,cw_total,exam,pct,grade\n")
+    lines = format_rows(store, rows)
+    while True:
+        batch = list(islice(lines, OUT_BATCH))
+        if not batch:
+            break
+        out.writelines(batch)
+
+
+def load(path):
+    if not os.path.exists(path):
+        sys.exit(f"error: no such file: {path}")
+    try:
+        store, backend, bad = load_store(path)
+    except Exception as e:
+        sys.exit(f"error: couldn't read {path}: {e}")
+    if bad:
+        print(f"warning: skipped {bad} bad lines in {path}", file=sys.stderr)
+    return store, backend
+
+
+def cmd_list(args):
+    store, _ = load(args.file)
+    print_rows(store, islice(store.order, args.limit), args.header)
+
+
+def cmd_find(args):
+    store, _ = load(args.file)
+    rows = store.search(args.query)
+    if not rows:
+        print(f"no students match {args.query!r}", file=sys.stderr)
+        return 1
+    print_rows(store, rows, args.header)
+
+
+def cmd_top(args):
+    # the pct index is already sorted, so this is the first (or last) n of it
+    store, _ = load(args.file)
+    print_rows(store, store.top(args.n, args.lowest) if store else [], args.header)
+
+
+def cmd_rank(args):
+    # where one student comes in the class
+    store, _ = load(args.file)
+    rid = store.find(args.code)
+    if rid is None:
+        print(f"no student with code {args.code}", file=sys.stderr)
+        return 1
+    print(f"{store.names[rid]} ({store.codes[rid]}) - {store.pct[rid]}%")
+    print(f"Rank: {store.rank(rid)} of {len(store)}")
+    print(f"Percentile: better than {store.percentile_rank(rid)}% of the class")
+
+
+def cmd_sort(args):
+    store, _ = load(args.file)
+    rows = store.sorted_rows(args.column) if store else []
+    print_rows(store, reversed(rows) if args.desc else rows, args.header)
+
+
+def cmd_query(args):
+    # the students matching some filters, a page at a time (see MarkStore.query)
+    store, _ = load(args.file)
+    try:
+        total, rows = store.query(grades=args.grade, pct=(args.min_pct, args.max_pct),
+                                  exam=(args.min_exam, args.max_exam), cw_total=(args.min_cw, args.max_cw),
+                                  name=args.name, order_by=args.sort, desc=args.desc,
+                                  offset=args.offset, limit=args.limit)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    shown = f"{args.offset + 1}-{args.offset + len(rows)}" if rows else "none"
+    print(f"{total} students match, showing {shown}", file=sys.stderr)
+    print_rows(store, rows, args.header)
+    return 0 if total else 1
+
+
+def cmd_stats(args):
+    store, _ = load(args.file)
+    print(class_summary(store))
+    if store:
+        for label, rid in (("Highest", store.best()), ("Lowest", store.worst())):
+            print(f"{label}: {store.names[rid]} ({store.codes[rid]}) - {store.pct[rid]}%")
+        print(f"Median: {store.median()}%    |    Quartiles: {store.percentile(25)}% / {store.percentile(75)}%")
+
+
+def cmd_export(args):
+    # write the same students in another format (picked from the file name)
+    store, _ = load(args.file)
+    target = open_backend(args.dest)
+    target.request_save(store)
+    target.write()
+    print(f"wrote {len(store)} students to {args.dest}", file=sys.stderr)
+
+
+def cmd_report(args):
+    # grade report for everyone, as CSV or JSON depending on the file name
+    store, _ = load(args.file)
+    rows = None
+    if args.sort:
+        rows = store.sorted_rows(args.sort) if store else []
+        rows = rows[::-1] if args.desc else rows
+    write_report(args.dest, store, rows)
+    print(f"wrote a report on {len(store)} students to {args.dest}", file=sys.stderr)
+
+
+def load_dest(path):
+    # the marks file to import into, a new empty one if it isn't there yet
+    if os.path.exists(path):
+        return load(path)
+    return MarkStore(), open_backend(path)
+
+
+def cmd_import(args):
+    # add the students from one file to another, replacing the marks of any
+    # student that's already there
+    if args.file.lower().endswith(".csv"):
+        return import_csv(args)
+    src, _ = load(args.file)
+    store, target = load_dest(args.dest)
+    added = updated = 0
+    for rid in src:
+        rec = src.get(rid)
+        marks = (rec["cw1"], rec["cw2"], rec["cw3"], rec["exam"])
+        have = store.find(rec["code"])
+        if have is None:
+            store.add(int(rec["code"]), rec["name"], *marks)
+            added += 1
+        else:
+            store.update(have, *marks)
+            updated += 1
+    target.request_save(store)
+    target.write()
+    print(f"{added} added, {updated} updated in {args.dest}", file=sys.stderr)
+
+
+def import_csv(args):
+    # a CSV file from somewhere else (e.g. Excel): every row is checked like the
+    # Add screen does, the good ones go in with one save, the rest are listed
+    if not os.path.exists(args.file):
+        sys.exit(f"error: no such file: {args.file}")
+    try:
+        rows, rejected = read_import_csv(args.file, args.workers)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        sys.exit(f"error: couldn't read {args.file}: {e}")
+    store, target = load_dest(args.dest)
+    changes, more = import_changes(store, rows, update=not args.no_update)
+    rejected = sorted(rejected + more)
+    store.apply_changes(changes)
+    target.request_save(store)
+    target.write()
+    added = sum(1 for change in changes if change[0] == "+")
+    print(f"{added} added, {len(changes) - added} updated, {len(rejected)} rejected in {args.dest}",
+          file=sys.stderr)
+    if args.rejects:
+        write_rejects(args.rejects, rejected)
+        return
+    for line, reason, _ in rejected[:REJECTS_SHOWN]:
+        print(f"  line {line}: {reason}", file=sys.stderr)
+    if len(rejected) > REJECTS_SHOWN:
+        print(f"  ...and {len(rejected) - REJECTS_SHOWN} more (use --rejects FILE to save them all)", file=sys.stderr)
+
+
+def cmd_cohort(args):
+    # every marks file in a folder (one per module), read in parallel and merged by student code
+    if not os.path.isdir(args.folder):
+        sys.exit(f"error: not a folder: {args.folder}")
+    paths = cohort_files(args.folder)
+    if not paths:
+        sys.exit(f"error: no marks files in {args.folder}")
+    cohort = load_cohort(paths, args.workers)
+    for name, error in cohort.failed:
+        print(f"warning: couldn't read {name}: {error}", file=sys.stderr)
+    out = sys.stdout
+    if args.students:
+        if args.header:
+            out.write("code,name,modules,avg_pct,best_pct,worst_pct,grade\n")
+        rows = (",".join(map(str, row)) + "\n" for row in cohort.rows())
+        while True:
+            batch = list(islice(rows, OUT_BATCH))
+            if not batch:
+                break
+            out.writelines(batch)
+        return
+    out.write("module,students,avg_pct,A,B,C,D,F,bad_lines\n")
+    for name, n, avg, grades, bad in cohort.modules:
+        out.write(f"{name},{n},{avg},{','.join(str(grades[g]) for g in 'ABCDF')},{bad}\n")
+    out.write("\n")
+    for label, value in cohort.summary():
+        out.write(f"{label}: {value}\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="marks_cli.py", description="Student marks without the window.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, fn, help_text):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("file", help="marks file (.txt, .smb, .db or .sqlite)")
+        p.set_defaults(fn=fn)
+        return p
+
+    def with_header(p):
+        p.add_argument("--header", action="store_true", help="print a column header line first")
+        return p
+
+    p = with_header(command("list", cmd_list, "every student in file order"))
+    p.add_argument("--limit", type=int, default=None, help="stop after this many students")
+    p = with_header(command("find", cmd_find, "search by code prefix or name (typos allowed)"))
+    p.add_argument("query")
+    p = with_header(command("top", cmd_top, "the N best (or worst) overall percentages"))
+    p.add_argument("n", type=int, nargs="?", default=10)
+    p.add_argument("--lowest", action="store_true", help="worst first instead")
+    p = command("rank", cmd_rank, "one student's rank and percentile in the class")
+    p.add_argument("code", help="student code")
+    p = with_header(command("sort", cmd_sort, "every student sorted by a column"))
+    p.add_argument("column", choices=SORT_COLUMNS)
+    p.add_argument("--desc", action="store_true", help="biggest first")
+    p = with_header(command("query", cmd_query, "students matching filters, sorted and a page at a time"))
+    p.add_argument("--grade", help="only these grades, e.g. DF")
+    for col, text in (("pct", "overall percentage"), ("exam", "exam mark"), ("cw", "coursework total")):
+        kind = float if col == "pct" else int
+        p.add_argument(f"--min-{col}", type=kind, help=f"lowest {text} (included)")
+        p.add_argument(f"--max-{col}", type=kind, help=f"highest {text} (included)")
+    p.add_argument("--name", help="names starting with this (any case)")
+    p.add_argument("--sort", choices=SORT_COLUMNS, help="order by a column (default: file order)")
+    p.add_argument("--desc", action="store_true", help="biggest first")
+    p.add_argument("--offset", type=int, default=0, help="skip this many matches first")
+    p.add_argument("--limit", type=int, default=None, help="show at most this many")
+    command("stats", cmd_stats, "class average, grade counts, highest and lowest")
+    p = command("export", cmd_export, "copy the students into another file/format")
+    p.add_argument("dest", help="file to write, the format comes from its extension")
+    p = command("report", cmd_report, "grade report with totals, percentages and grades")
+    p.add_argument("dest", help="report to write (.csv or .json)")
+    p.add_argument("--sort", choices=SORT_COLUMNS, help="order the students by a column")
+    p.add_argument("--desc", action="store_true", help="biggest first")
+    p = command("import", cmd_import, "add/update the students from FILE (a marks file or any .csv) in DEST")
+    p.add_argument("dest", help="marks file to add the students to (created if missing)")
+    p.add_argument("--no-update", action="store_true",
+                   help="reject students that are already in DEST instead of updating their marks (CSV only)")
+    p.add_argument("--rejects", help="save the rejected CSV rows and why to this file")
+    p.add_argument("--workers", type=int, default=None, help="processes checking the CSV (default: one per core)")
+    p = sub.add_parser("cohort", help="merge a folder of module files and show cross-module statistics")
+    p.add_argument("folder", help="folder of marks files, one per module")
+    p.add_argument("--workers", type=int, default=None, help="processes to use (default: one per core)")
+    p.add_argument("--students", action="store_true",
+                   help="list every student's modules, average, best, worst and grade instead")
+    p.add_argument("--header", action="store_true", help="print a column header line first (with --students)")
+    p.set_defaults(fn=cmd_cohort)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.fn(args) or 0
+    except BrokenPipeError:
+        # the reader went away (e.g. "| head"), that's fine - point stdout at
+        # devnull so Python doesn't complain again when it flushes on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
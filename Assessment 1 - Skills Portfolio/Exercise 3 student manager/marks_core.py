@@ -0,0 +1,1557 @@
+# The student marks data and everything worked out from it, with no Tk in sight.
+# The window ("student manager & extension.py") and the command line (marks_cli.py)
+# both sit on top of this.
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, deque
+import csv
+import heapq
+from itertools import chain, islice, repeat
+import json
+import mmap
+from math import fsum
+import multiprocessing
+from operator import add, mul
+import os
+from pathlib import Path
+import sqlite3
+import struct
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # grade_columns does the same job in plain Python then
+
+
+# log each change to "<marks file>.journal" instead of rewriting the whole file,
+# set to False to go back to saving everything after every change
+JOURNAL = True
+# fold the journal back into the marks file after this many changes
+COMPACT_EVERY = 500
+# how many changes (a whole batch counts as one) the window can undo
+UNDO_LIMIT = 100
+
+# the loader reads the marks file this many bytes at a time in the background
+LOAD_CHUNK_BYTES = 1 << 20
+
+# most "did you mean" results shown when nothing contains the search text
+FUZZY_LIMIT = 50
+
+# Binary marks files (".smb"): a header, then one packed column per field, then
+# the names joined by newlines. They open with a few memcpys instead of parsing.
+BIN_EXT = ".smb"
+BIN_MAGIC = b"SMKS"
+BIN_VERSION = 1
+BIN_HEADER = struct.Struct("<4sIQQ") # magic, version, student count, bytes of names
+BIN_HEADER_SIZE = 32 # header padded so the columns start 8-byte aligned
+# the packed columns in the order they're stored, with their array typecodes
+BIN_COLUMNS = [("codes", "i"), ("cw1", "h"), ("cw2", "h"), ("cw3", "h"), ("exam", "h"),
+               ("cw_tot", "h"), ("pct", "d"), ("grades", "B")]
+# batches of changes bigger than this drop the sorted indexes and build them again
+# when they're next needed (one sort) instead of moving every row into place
+REINDEX_AT = 64
+# below this many students grade_columns doesn't bother with NumPy
+NUMPY_MIN_ROWS = 5000
+# columns in CSV/JSON reports
+REPORT_FIELDS = ["code", "name", "cw1", "cw2", "cw3", "cw_total", "exam", "pct", "grade"]
+
+# marks files picked up when a whole folder of modules is loaded (see load_cohort)
+COHORT_EXTS = (".txt", ".smb", ".db", ".sqlite")
+
+# Process pools start their workers fresh instead of forking: the window runs them
+# from a worker thread, and a process forked while other threads hold locks can hang
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+# CSV imports (see read_import_csv): rows checked per worker, and the header names
+# understood for each column (compared in lowercase with anything but letters and digits removed)
+IMPORT_CHUNK_ROWS = 20000
+IMPORT_HEADERS = {
+    "code": ("code", "studentcode", "id", "studentid", "studentnumber", "number"),
+    "name": ("name", "studentname", "fullname"),
+    "cw1": ("cw1", "coursework1", "mark1"),
+    "cw2": ("cw2", "coursework2", "mark2"),
+    "cw3": ("cw3", "coursework3", "mark3"),
+    "exam": ("exam", "exammark", "finalexam"),
+}
+
+# SQLite databases - every change is a single-row transaction, no journal needed
+SQLITE_EXTS = (".db", ".sqlite")
+# rows fetched from the database per loader chunk
+SQLITE_CHUNK_ROWS = 20000
+
+
+def grade_from_pct(pct):
+    # simple grading logic based on percentage
+    if pct >= 70:
+        return "A"
+    if pct >= 60:
+        return "B"
+    if pct >= 50:
+        return "C"
+    if pct >= 40:
+        return "D"
+    return "F"
+
+
+def overall_pct(cw1, cw2, cw3, exam):
+    # overall percentage (total / 160)
+    return round(((cw1 + cw2 + cw3 + exam) / 160) * 100, 2)
+
+
+def grade_columns(cw1, cw2, cw3, exam):
+    # Coursework totals, percentages and grades for whole columns at once.
+    # The percentage only depends on the total mark, so each different total is
+    # worked out once with overall_pct/grade_from_pct (the numbers come out exactly
+    # like the per-student ones) and the columns are filled in by looking it up.
+    # Returns (cw_tot array "h", pct array "d", grades bytearray).
+    if np is not None and len(cw1) >= NUMPY_MIN_ROWS:
+        a, b, c, e = (np.frombuffer(col, dtype=np.int16).astype(np.int32) for col in (cw1, cw2, cw3, exam))
+        cw = a + b + c
+        if cw.min() < -32768 or cw.max() > 32767:
+            raise OverflowError("coursework total doesn't fit")
+        tot = cw + e
+        lo, hi = int(tot.min()), int(tot.max())
+        pct_table = np.array([overall_pct(t, 0, 0, 0) for t in range(lo, hi + 1)])
+        grade_table = np.array([ord(grade_from_pct(p)) for p in pct_table], dtype=np.uint8)
+        tot -= lo
+        return (array("h", cw.astype(np.int16).tobytes()), array("d", pct_table[tot].tobytes()),
+                bytearray(grade_table[tot].tobytes()))
+    cw = array("h", map(add, map(add, cw1, cw2), cw3))
+    tot = list(map(add, cw, exam))
+    pct_of = {t: overall_pct(t, 0, 0, 0) for t in set(tot)}
+    grade_of = {t: ord(grade_from_pct(p)) for t, p in pct_of.items()}
+    return cw, array("d", map(pct_of.__getitem__, tot)), bytearray(map(grade_of.__getitem__, tot))
+
+
+def parse_line(ln):
+    # turn one "code,name,cw1,cw2,cw3,exam" line into a tuple, None if it looks wrong
+    parts = ln.split(",")
+    if len(parts) != 6:
+        return None
+    code, name, a, b, c, exam = parts
+    try:
+        return int(code), name.strip(), int(a), int(b), int(c), int(exam)
+    except ValueError:
+        return None
+
+
+def read_marks_chunks(path, chunk_bytes=LOAD_CHUNK_BYTES):
+    # Read the marks file a piece at a time instead of all at once.
+    # Yields (rows, bad, chars_read) for every chunk, rows being parse_line tuples.
+    with open(path, "r") as f:
+        first = f.readline()
+        read = 0
+        # handle the optional student count line at the top
+        try:
+            limit = int(first.strip())
+            read = len(first)
+            pending = []
+        except ValueError:
+            limit = None
+            pending = [first]
+        while True:
+            lines = pending + f.readlines(chunk_bytes)
+            pending = []
+            if not lines:
+                break
+            if limit is not None:
+                lines = lines[:limit]
+                limit -= len(lines)
+            rows, bad = [], 0
+            for ln in lines:
+                read += len(ln)
+                ln = ln.strip()
+                if not ln:
+                    continue
+                rec = parse_line(ln)
+                if rec is None:
+                    bad += 1 # wrong number of fields or not a number, skip this line
+                else:
+                    rows.append(rec)
+            yield rows, bad, read
+            if limit == 0:
+                break
+
+
+class SortedIndex:
+    # Row ids kept sorted by one column, so the table can be shown in that order
+    # without sorting anything. It's built the first time it's asked for (one
+    # sort), then every add/edit/delete just moves that one row id into place.
+    def __init__(self, key):
+        self.key = key    # row id -> value to sort by
+        self.rows = None  # array of row ids, None until built
+
+    def key_of(self, rid):
+        # ties go by row id, so equal values stay in the order they were added
+        return (self.key(rid), rid)
+
+    def build(self, order):
+        self.rows = array("i", sorted(order, key=self.key_of))
+
+    def add(self, rid):
+        if self.rows is not None:
+            insort(self.rows, rid, key=self.key_of)
+
+    def remove(self, rid):
+        # has to be called while the row still has its old value
+        if self.rows is not None:
+            del self.rows[bisect_left(self.rows, self.key_of(rid), key=self.key_of)]
+
+
+class NameIndex:
+    # Trigram index over the names ("lee" -> " le", "lee", "ee "), so a search
+    # only looks at students whose names share a piece of the query instead of
+    # going through everyone. Built on the first search, then kept up to date.
+    def __init__(self, names):
+        self.names = names
+        self.grams = None # trigram -> array of row ids, None until built
+
+    @staticmethod
+    def trigrams(text, pad=True):
+        if pad:
+            text = f" {text} "
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def build(self, order):
+        self.grams = {}
+        for rid in order:
+            self.add(rid)
+
+    def add(self, rid):
+        # deleted rows are left in (their name is None) and skipped when searching
+        if self.grams is None:
+            return
+        for g in self.trigrams(self.names[rid].lower()):
+            posting = self.grams.get(g)
+            if posting is None:
+                self.grams[g] = array("i", (rid,))
+            else:
+                posting.append(rid)
+
+    def containing(self, q):
+        # row ids whose name contains q (lowercase, 3+ letters)
+        names = self.names
+        # every match has all of q's trigrams, so the rarest one is enough to start from
+        postings = [self.grams.get(g, ()) for g in self.trigrams(q, pad=False)]
+        smallest = min(postings, key=len)
+        return [rid for rid in dict.fromkeys(smallest)
+                if names[rid] is not None and q in names[rid].lower()]
+
+    def similar(self, q, limit=FUZZY_LIMIT):
+        # closest names by shared trigrams, for typos ("le scott" finds "Lee Scott")
+        wanted = self.trigrams(q)
+        shared = Counter()
+        for g in wanted:
+            shared.update(set(self.grams.get(g, ())))
+        best = []
+        for rid, n in shared.most_common():
+            if n * 2 < len(wanted) or len(best) >= limit:
+                break # less than half the trigrams in common isn't a match
+            if self.names[rid] is not None:
+                best.append(rid)
+        return best
+
+
+class MarkStore:
+    # All the students, kept as one array per field instead of one dict per student.
+    # A dict costs a few hundred bytes, a row here is about 20 plus the name.
+    # Every student gets a row id (its position in the arrays) that never changes
+    # while the file is open, and `order` lists the row ids in file order.
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.codes = array("i")
+        self.cw1 = array("h")
+        self.cw2 = array("h")
+        self.cw3 = array("h")
+        self.exam = array("h")
+        self.names = []  # interned so the same name is only stored once
+        # worked out once per student and only redone when their marks change
+        self.cw_tot = array("h")  # coursework total
+        self.pct = array("d")     # overall percentage
+        self.grades = bytearray() # grade letter as a byte (b"A"[0] etc.)
+        self.order = array("i")
+        self.by_code = {}  # student code -> row id, so lookups don't scan every row
+        # class statistics kept up to date on every add/edit/delete, so the summary
+        # and highest/lowest never have to look at every student
+        self.pct_cents = 0 # sum of everyone's percentage, in hundredths so it stays exact
+        self.grade_counts = {g: 0 for g in "ABCDF"}
+        self.low_heap = None  # (pct, row id) - smallest on top, built when first needed
+        self.high_heap = None # (-pct, row id) - biggest on top
+        # one sorted index per table column, see SortedIndex
+        self.indexes = {
+            "code": SortedIndex(self.codes.__getitem__),
+            "name": SortedIndex(lambda rid: self.names[rid].lower()),
+            "cw_total": SortedIndex(self.cw_tot.__getitem__),
+            "exam": SortedIndex(self.exam.__getitem__),
+            "pct": SortedIndex(self.pct.__getitem__),
+            "grade": SortedIndex(self.grades.__getitem__), # the letter bytes sort A < B < ... < F
+        }
+        self.name_index = NameIndex(self.names)
+        # goes up on every change, so background results can tell if they're out of date
+        self.version = getattr(self, "version", 0) + 1
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def add(self, code, name, cw1, cw2, cw3, exam):
+        if code in self.by_code:
+            raise ValueError("A student with this code already exists")
+        # build the marks first so a number that doesn't fit fails before anything changes
+        marks = array("h", (cw1, cw2, cw3, exam))
+        rid = len(self.codes)
+        self.codes.append(code)
+        self.cw1.append(marks[0])
+        self.cw2.append(marks[1])
+        self.cw3.append(marks[2])
+        self.exam.append(marks[3])
+        self.names.append(sys.intern(name))
+        self.cw_tot.append(0)
+        self.pct.append(0.0)
+        self.grades.append(0)
+        self._derive(rid)
+        self.order.append(rid)
+        self.by_code[code] = rid
+        self._count_in(rid)
+        for idx in self.indexes.values():
+            idx.add(rid)
+        self.name_index.add(rid)
+        self.version += 1
+        return rid
+
+    def add_many(self, rows):
+        # Add a list of parse_line tuples in one go, grading them all with
+        # grade_columns. Returns how many were skipped (same code twice, or a
+        # number too big) - those batches go through add() one at a time instead.
+        if not rows:
+            return 0
+        codes, names, c1, c2, c3, ex = zip(*rows)
+        try:
+            cols = [array("i", codes), array("h", c1), array("h", c2), array("h", c3), array("h", ex)]
+            derived = grade_columns(*cols[1:])
+        except OverflowError:
+            cols = None
+        if cols is None or len(set(codes)) != len(codes) or not self.by_code.keys().isdisjoint(codes):
+            skipped = 0
+            for rec in rows:
+                try:
+                    self.add(*rec)
+                except (OverflowError, ValueError):
+                    skipped += 1
+            return skipped
+        start, n = len(self.codes), len(rows)
+        for field, col in zip(("codes", "cw1", "cw2", "cw3", "exam", "cw_tot", "pct", "grades"),
+                              cols + list(derived)):
+            getattr(self, field).extend(col) # extend in place, the indexes hold these
+        self.names.extend(map(sys.intern, names))
+        new = range(start, start + n)
+        self.order.extend(new)
+        self.by_code.update(zip(codes, new))
+        pct, grades = derived[1], derived[2]
+        self.pct_cents += sum(map(round, map(mul, pct, repeat(100))))
+        for g in self.grade_counts:
+            self.grade_counts[g] += grades.count(ord(g))
+        # anything already built is cheaper to rebuild later than to insert into n times
+        self.drop_indexes()
+        self.version += 1
+        return 0
+
+    def drop_indexes(self):
+        # forget the sorted indexes, trigrams and heaps, they get built again when needed
+        self.low_heap = self.high_heap = None
+        for idx in self.indexes.values():
+            idx.rows = None
+        self.name_index.grams = None
+
+    def update(self, rid, cw1, cw2, cw3, exam):
+        # code and name can't change, so those two indexes stay as they are
+        moved = [self.indexes[k] for k in ("cw_total", "exam", "pct", "grade")]
+        for idx in moved:
+            idx.remove(rid)
+        self._count_out(rid)
+        self.cw1[rid], self.cw2[rid], self.cw3[rid], self.exam[rid] = cw1, cw2, cw3, exam
+        self._derive(rid)
+        self._count_in(rid)
+        for idx in moved:
+            idx.add(rid)
+        self.version += 1
+
+    def load_columns(self, cols, names):
+        # fill an empty store straight from whole columns (see read_marks_bin),
+        # with no per-student work in Python - the indexes and heaps come later
+        self.clear()
+        n = len(cols["codes"])
+        for field, _ in BIN_COLUMNS:
+            getattr(self, field).extend(cols[field]) # extend in place, the indexes hold these
+        self.names.extend(map(sys.intern, names))
+        self.order.extend(range(n))
+        self.by_code.update(zip(self.codes, range(n)))
+        if len(self.by_code) != n or len(self.names) != n:
+            self.clear()
+            raise ValueError("the file has the same student code twice or is damaged")
+        self.pct_cents = sum(map(round, map(mul, self.pct, repeat(100))))
+        self.grade_counts = {g: self.grades.count(ord(g)) for g in "ABCDF"}
+        self.version += 1
+
+    def _derive(self, rid):
+        # refresh the cached values for one row after its marks changed
+        cw = self.cw1[rid] + self.cw2[rid] + self.cw3[rid]
+        pct = overall_pct(self.cw1[rid], self.cw2[rid], self.cw3[rid], self.exam[rid])
+        self.cw_tot[rid] = cw
+        self.pct[rid] = pct
+        self.grades[rid] = ord(grade_from_pct(pct))
+
+    def delete(self, rid):
+        self.order.remove(rid)
+        del self.by_code[self.codes[rid]]
+        self._count_out(rid)
+        for idx in self.indexes.values():
+            idx.remove(rid)
+        # the row stays in the arrays so other row ids don't move, a missing
+        # name is what marks it as deleted
+        self.names[rid] = None
+        self.version += 1
+
+    def delete_many(self, rids):
+        # delete a batch of students with one pass over `order` instead of one each
+        if len(rids) <= REINDEX_AT:
+            for rid in rids:
+                self.delete(rid)
+            return
+        self.drop_indexes()
+        for rid in rids:
+            del self.by_code[self.codes[rid]]
+            self._count_out(rid)
+            self.names[rid] = None
+        names = self.names
+        self.order = array("i", (rid for rid in self.order if names[rid] is not None))
+        self.version += 1
+
+    def apply_changes(self, changes):
+        # apply a list of changes from diff_stores: edits as they come, then the
+        # deletes, then the adds (a renamed student comes as a delete and an add of
+        # the same code, so the add has to wait for the delete)
+        if len(changes) > REINDEX_AT:
+            self.drop_indexes()
+        gone, added = [], []
+        for op, code, *fields in changes:
+            if op == "-":
+                gone.append(self.by_code[code])
+            elif op == "=":
+                self.update(self.by_code[code], *fields)
+            else:
+                added.append((code, *fields))
+        self.delete_many(gone)
+        if len(added) > REINDEX_AT:
+            self.add_many(added)
+            return
+        # a few adds go in one at a time, so the indexes and heaps stay built
+        for rec in added:
+            try:
+                self.add(*rec)
+            except (OverflowError, ValueError):
+                pass # skipped, like add_many does
+
+    def _count_in(self, rid):
+        pct = self.pct[rid]
+        self.pct_cents += round(pct * 100)
+        self.grade_counts[chr(self.grades[rid])] += 1
+        if self.low_heap is not None:
+            heapq.heappush(self.low_heap, (pct, rid))
+            heapq.heappush(self.high_heap, (-pct, rid))
+
+    def _count_out(self, rid):
+        # the heaps are cleaned up lazily in _peek, old entries just stop matching
+        self.pct_cents -= round(self.pct[rid] * 100)
+        self.grade_counts[chr(self.grades[rid])] -= 1
+
+    def _peek(self, sign):
+        # top of the low (sign 1) or high (sign -1) heap, dropping entries for
+        # students that were deleted or edited since
+        if self.low_heap is None or len(self.low_heap) > 2 * len(self.order) + 64:
+            # not built yet, or mostly stale entries - start again from the live rows
+            self.low_heap = [(self.pct[rid], rid) for rid in self.order]
+            self.high_heap = [(-p, rid) for p, rid in self.low_heap]
+            heapq.heapify(self.low_heap)
+            heapq.heapify(self.high_heap)
+        heap = self.low_heap if sign == 1 else self.high_heap
+        while heap:
+            p, rid = heap[0]
+            if self.names[rid] is not None and self.pct[rid] == sign * p:
+                return rid
+            heapq.heappop(heap)
+        return None
+
+    def copy(self):
+        # a snapshot for background threads, so they never read arrays the
+        # window is changing at the same time (copying an array is a quick memcpy)
+        snap = MarkStore.__new__(MarkStore)
+        snap.codes, snap.order = array("i", self.codes), array("i", self.order)
+        snap.cw1, snap.cw2 = array("h", self.cw1), array("h", self.cw2)
+        snap.cw3, snap.exam = array("h", self.cw3), array("h", self.exam)
+        snap.names = list(self.names)
+        snap.cw_tot, snap.pct = array("h", self.cw_tot), array("d", self.pct)
+        snap.grades = bytearray(self.grades)
+        snap.pct_cents, snap.grade_counts = self.pct_cents, dict(self.grade_counts)
+        snap.low_heap = snap.high_heap = None # rebuilt if the snapshot needs them
+        snap.indexes = {} # not needed on a snapshot
+        snap.by_code = self.by_code # only read by find(), shared is fine
+        snap.version = self.version
+        return snap
+
+    def find(self, code):
+        # row id for a student code (a number or a string of digits), None if there isn't one
+        try:
+            return self.by_code.get(int(code))
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, rid):
+        # a plain dict copy of one student, handy for showing it on screen
+        return {"code": str(self.codes[rid]), "name": self.names[rid],
+                "cw1": self.cw1[rid], "cw2": self.cw2[rid], "cw3": self.cw3[rid],
+                "exam": self.exam[rid]}
+
+    def cw_total(self, rid):
+        # total coursework score (out of 60)
+        return self.cw_tot[rid]
+
+    def overall_pct(self, rid):
+        # overall percentage (total / 160)
+        return self.pct[rid]
+
+    def grade(self, rid):
+        return chr(self.grades[rid])
+
+    # --- class statistics, all kept up to date as students change ---
+    def average_pct(self):
+        return round(self.pct_cents / 100 / len(self.order), 2)
+
+    def best(self):
+        return self._peek(-1)
+
+    def worst(self):
+        return self._peek(1)
+
+    # --- rankings, read off the sorted pct index (kept in order on every change) ---
+    def top(self, n, lowest=False):
+        # the n best students, best first (or the n worst, worst first)
+        rows = self.sorted_rows("pct")
+        if n <= 0:
+            return []
+        return list(rows[:n]) if lowest else list(rows[-n:])[::-1]
+
+    def rank(self, rid):
+        # 1 for the best overall percentage, students on the same % share a rank
+        rows = self.sorted_rows("pct")
+        above = len(rows) - bisect_right(rows, (self.pct[rid], len(self.codes)), key=self.indexes["pct"].key_of)
+        return above + 1
+
+    def percentile_rank(self, rid):
+        # percentage of the class with a lower overall percentage than this student
+        rows = self.sorted_rows("pct")
+        below = bisect_left(rows, (self.pct[rid], -1), key=self.indexes["pct"].key_of)
+        return round(below * 100 / len(rows), 2)
+
+    def percentile(self, p):
+        # the overall percentage p% of the way up the class (50 is the median),
+        # between the two nearest students when it falls between them
+        rows = self.sorted_rows("pct")
+        if not rows:
+            return None
+        pos = (len(rows) - 1) * min(100, max(0, p)) / 100
+        low = int(pos)
+        high = min(low + 1, len(rows) - 1)
+        a, b = self.pct[rows[low]], self.pct[rows[high]]
+        return round(a + (b - a) * (pos - low), 2)
+
+    def median(self):
+        return self.percentile(50)
+
+    def search(self, q):
+        # row ids matching a search, best matches first:
+        # digits are a code prefix, 1-2 letters a name prefix, anything longer is
+        # found anywhere in the name, and if nothing has it, the closest names
+        q = q.strip().lower()
+        if not q or not self.order:
+            return []
+        if q.isdigit():
+            return self._code_prefix(q)
+        if len(q) < 3:
+            return self._name_prefix(q)
+        if self.name_index.grams is None:
+            self.name_index.build(self.order)
+        hits = self.name_index.containing(q)
+        if not hits:
+            return self.name_index.similar(q)
+        names = self.names
+
+        def rank(rid):
+            n = names[rid].lower()
+            if n == q:
+                tier = 0
+            elif n.startswith(q):
+                tier = 1
+            elif f" {q}" in n:
+                tier = 2 # starts a word, e.g. a surname
+            else:
+                tier = 3
+            return (tier, n, rid)
+        return sorted(hits, key=rank)
+
+    def _code_prefix(self, q):
+        # codes starting with q, using the sorted code index: for "98" that's
+        # 98, 980-989, 9800-9899 and so on up to the longest code there is
+        rows = self.sorted_rows("code")
+        key = self.codes.__getitem__
+        longest = len(str(self.codes[rows[-1]]))
+        found = []
+        for extra in range(longest - len(q) + 1):
+            lo = int(q) * 10 ** extra
+            hi = (int(q) + 1) * 10 ** extra
+            found.extend(rows[bisect_left(rows, lo, key=key):bisect_left(rows, hi, key=key)])
+        return found
+
+    def _name_prefix(self, q):
+        # names starting with q, using the sorted name index
+        rows = self.sorted_rows("name")
+        key = lambda rid: self.names[rid].lower()
+        lo = bisect_left(rows, q, key=key)
+        hi = bisect_left(rows, q + "\uffff", key=key)
+        return list(rows[lo:hi])
+
+    def query(self, grades=None, pct=None, exam=None, cw_total=None, name=None,
+              order_by=None, desc=False, offset=0, limit=None):
+        # Students matching every filter given, e.g. all Fs with under 30 in the exam:
+        #   store.query(grades="F", exam=(None, 29), order_by="pct")
+        # pct, exam and cw_total are (low, high) with both ends included and None for
+        # no limit, grades is any letters from "ABCDF" and name is the start of a name
+        # (any case). Returns (how many match, their row ids from offset to offset+limit)
+        # in order_by order, or in the order they were added when it's None.
+        # Each filter is a range of its column's sorted index, found by bisecting, and
+        # the smallest range is read straight off the index - only the students in it
+        # get looked at, and the other filters are tested on just those.
+        if order_by is not None and order_by not in self.indexes:
+            raise ValueError(f"can't order by {order_by!r}")
+        filters = [] # (how many the range holds, index key, [(start, stop) in the index], test)
+        if grades is not None:
+            letters = sorted(set(grades.upper()))
+            if not set(letters) <= set(self.grade_counts):
+                raise ValueError(f"grades are A, B, C, D and F, not {grades!r}")
+            wanted = set(map(ord, letters))
+            filters.append(self._filter_range("grade", [(ord(g), ord(g)) for g in letters],
+                                              lambda rid: self.grades[rid] in wanted))
+        for key, bounds, col in (("pct", pct, self.pct), ("exam", exam, self.exam), ("cw_total", cw_total, self.cw_tot)):
+            if bounds is not None and bounds != (None, None): # (None, None) is no filter at all
+                low, high = bounds
+                filters.append(self._filter_range(key, [bounds], lambda rid, col=col, low=low, high=high:
+                                                  (low is None or col[rid] >= low) and (high is None or col[rid] <= high)))
+        if name:
+            prefix = name.strip().lower()
+            filters.append(self._filter_range("name", [(prefix, prefix + "\uffff")],
+                                              lambda rid: self.names[rid].lower().startswith(prefix)))
+        if not filters:
+            # nothing to filter - a page of the index (or the file order) as it is, no copying
+            rows = self.sorted_rows(order_by) if order_by else self.order
+        else:
+            filters.sort(key=lambda f: f[0])
+            _, key, spans, _ = filters[0]
+            index = self.sorted_rows(key)
+            rows = [rid for start, stop in spans for rid in index[start:stop]]
+            for _, _, _, test in filters[1:]:
+                rows = list(filter(test, rows))
+            if order_by is None:
+                rows.sort() # row ids go up in the order students were added
+            elif order_by != key:
+                rows.sort(key=self.indexes[order_by].key_of)
+        n = len(rows)
+        stop = n if limit is None else min(n, offset + limit)
+        if not desc:
+            return n, list(rows[offset:stop])
+        # descending is the ascending rows read backwards
+        return n, list(rows[max(0, n - stop):max(0, n - offset)])[::-1]
+
+    def _filter_range(self, key, bounds, test):
+        # where each (low, high) of a column is in its sorted index, for query
+        rows = self.sorted_rows(key)
+        key_of = self.indexes[key].key_of
+        last = len(self.codes) # bigger than any row id, so ties with `high` are included
+        spans = []
+        for low, high in bounds:
+            start = 0 if low is None else bisect_left(rows, (low, -1), key=key_of)
+            stop = len(rows) if high is None else bisect_right(rows, (high, last), key=key_of)
+            if start < stop:
+                spans.append((start, stop))
+        return sum(stop - start for start, stop in spans), key, spans, test
+
+    def sorted_rows(self, key):
+        # row ids in ascending order of a table column (builds its index the first time)
+        idx = self.indexes[key]
+        if idx.rows is None:
+            idx.build(self.order)
+        return idx.rows
+
+    def sorted_position(self, key, rid):
+        # where a row is in sorted_rows(key), by bisecting rather than searching
+        idx = self.indexes[key]
+        return bisect_left(self.sorted_rows(key), idx.key_of(rid), key=idx.key_of)
+
+    def lines(self):
+        # the rows in file order, formatted the way studentMarks.txt stores them
+        codes, names = self.codes, self.names
+        cw1, cw2, cw3, exam = self.cw1, self.cw2, self.cw3, self.exam
+        for rid in self.order:
+            yield f"{codes[rid]},{names[rid]},{cw1[rid]},{cw2[rid]},{cw3[rid]},{exam[rid]}\n"
+
+
+def write_marks_file(path, store):
+    # save in whichever format the file name says
+    if path.endswith(BIN_EXT):
+        write_marks_bin(path, store)
+    elif path.endswith(SQLITE_EXTS):
+        write_marks_sqlite(path, store)
+    else:
+        write_marks_text(path, store)
+
+
+def write_marks_text(path, store):
+    # write to a temp file first and swap it in, so a crash half way through
+    # never leaves a half-written marks file behind
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        # write the number of records first
+        f.write(str(len(store)) + "\n")
+        # write each record as a comma-separated line
+        f.writelines(store.lines())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_marks_bin(path, store):
+    # the binary layout described at BIN_EXT, rows in file order
+    rows = store.order
+    names = "\n".join(map(store.names.__getitem__, rows)).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, len(rows), len(names)).ljust(BIN_HEADER_SIZE, b"\0"))
+        for field, typecode in BIN_COLUMNS:
+            col = array(typecode, map(getattr(store, field).__getitem__, rows))
+            if sys.byteorder == "big":
+                col.byteswap() # the file is always little-endian
+            data = col.tobytes()
+            f.write(data + b"\0" * (-len(data) % 8)) # keep the next column aligned
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_marks_bin(path):
+    # Memory-map a binary marks file and copy each column out of it in one go.
+    # Returns ({field: array}, names) ready for MarkStore.load_columns.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < BIN_HEADER_SIZE:
+            raise ValueError("not a student marks file (too short)")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            magic, version, n, names_len = BIN_HEADER.unpack_from(view)
+            if magic != BIN_MAGIC or version != BIN_VERSION:
+                raise ValueError("not a student marks file (or made by a newer version)")
+            pos = BIN_HEADER_SIZE
+            cols = {}
+            for field, typecode in BIN_COLUMNS:
+                col = array(typecode)
+                size = n * col.itemsize
+                col.frombytes(view[pos:pos + size])
+                if sys.byteorder == "big":
+                    col.byteswap()
+                cols[field] = col
+                pos += size + (-size % 8)
+            text = str(view[pos:pos + names_len], "utf-8")
+    names = text.split("\n") if n else []
+    return cols, names
+
+
+class Journal:
+    # Append-only log of changes, kept next to the marks file as "<file>.journal".
+    # Every change is one short line, so an edit writes a few bytes instead of the
+    # whole file, and the log gets folded back into the marks file now and then.
+    #   +,code,name,cw1,cw2,cw3,exam   added a student
+    #   =,code,cw1,cw2,cw3,exam        changed their marks
+    #   -,code                         deleted them
+    # log() and request_compact() are called from the window, write() from a
+    # background thread, and write() always does whatever is waiting at that
+    # moment - so several quick changes end up as one write.
+    def __init__(self, path):
+        self.path = path + ".journal"
+        self.entries = 0 # lines in the log since the last compaction
+        self.pending = [] # lines not written yet
+        self.snapshot = None # a store copy waiting to be written as the marks file
+        self.lock = threading.Lock()
+
+    def log(self, *fields):
+        with self.lock:
+            self.pending.append(",".join(str(x) for x in fields) + "\n")
+            self.entries += 1
+
+    def request_compact(self, store):
+        # the snapshot already has every change so far, so the waiting lines aren't needed
+        snap = store.copy()
+        with self.lock:
+            self.snapshot = snap
+            self.pending = []
+            self.entries = 0
+
+    def write(self, marks_path):
+        # returns True when the marks file itself was rewritten
+        with self.lock:
+            snap, self.snapshot = self.snapshot, None
+            lines, self.pending = self.pending, []
+        if snap is not None:
+            write_marks_file(marks_path, snap)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        if lines:
+            with open(self.path, "a") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        return snap is not None
+
+    def replay(self, store):
+        # apply the logged changes on top of what was loaded from the marks file.
+        # Replaying twice gives the same result, which matters if we crashed
+        # after compacting but before the old journal was removed.
+        self.entries = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for ln in f:
+                if not ln.endswith("\n"):
+                    break # half-written last line from a crash
+                parts = ln.rstrip("\n").split(",")
+                try:
+                    self._apply(store, parts)
+                except (ValueError, IndexError, OverflowError):
+                    continue # a broken line, skip it like bad lines in the marks file
+                self.entries += 1
+
+    def _apply(self, store, parts):
+        op = parts[0]
+        if op == "+":
+            code, name = int(parts[1]), parts[2]
+            marks = [int(x) for x in parts[3:7]]
+            rid = store.find(code)
+            if rid is None:
+                store.add(code, name, *marks)
+            else:
+                store.update(rid, *marks)
+        elif op == "=":
+            rid = store.find(parts[1])
+            if rid is not None:
+                store.update(rid, *[int(x) for x in parts[2:6]])
+        elif op == "-":
+            rid = store.find(parts[1])
+            if rid is not None:
+                store.delete(rid)
+        else:
+            raise ValueError(op)
+
+
+# --- Storage backends ---
+# Both backends work the same way: the loader runs read() on a worker thread,
+# the window calls log() for each change and request_save() for a full save,
+# and write() runs on a worker (one at a time) to put whatever is waiting on disk.
+# write() returns the marks file's file_signature from just before and just after
+# it wrote to it (None if it didn't), so the window's file watcher can tell our own
+# saves from another program's.
+
+class FileBackend:
+    # studentMarks.txt (or a binary .smb file) plus the change journal
+    def __init__(self, path):
+        self.path = path
+        self.journal = Journal(path) if JOURNAL else None
+        self.snapshot = None # whole-file save waiting, when journaling is off
+        self.lock = threading.Lock()
+
+    def read(self, cancel):
+        # yields ("chunk", (rows, bad, fraction done)) or ("columns", ...) for the loader
+        if self.path.endswith(BIN_EXT):
+            # binary files come in whole, they only take a moment
+            yield ("columns", read_marks_bin(self.path))
+            return
+        size = max(1, os.path.getsize(self.path))
+        for rows, bad, read in read_marks_chunks(self.path):
+            if cancel.is_set():
+                return
+            yield ("chunk", (rows, bad, read / size))
+
+    def after_load(self, store):
+        # changes made since the file was last compacted
+        if self.journal:
+            self.journal.replay(store)
+
+    def log(self, *fields):
+        # note one change, returns True when it's time for a full save instead
+        if not self.journal:
+            return True
+        self.journal.log(*fields)
+        return self.journal.entries >= COMPACT_EVERY
+
+    def unsaved(self):
+        return bool(self.journal and self.journal.entries)
+
+    def request_save(self, store):
+        if self.journal:
+            self.journal.request_compact(store)
+        else:
+            snap = store.copy()
+            with self.lock:
+                self.snapshot = snap
+
+    def write(self):
+        before = file_signature(self.path)
+        if self.journal:
+            if self.journal.write(self.path):
+                return before, file_signature(self.path)
+            return None # only the journal grew
+        with self.lock:
+            snap, self.snapshot = self.snapshot, None
+        if snap is not None:
+            write_marks_file(self.path, snap)
+            return before, file_signature(self.path)
+        return None
+
+
+# made (or brought up to date) the first time a database is written to, never
+# when one is only read
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    code INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    cw1 INTEGER NOT NULL,
+    cw2 INTEGER NOT NULL,
+    cw3 INTEGER NOT NULL,
+    exam INTEGER NOT NULL,
+    pct REAL NOT NULL,
+    pos INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS students_pos ON students (pos);
+DROP INDEX IF EXISTS students_name;
+DROP INDEX IF EXISTS students_pct;
+"""
+SQLITE_ADD = ("INSERT INTO students (code, name, cw1, cw2, cw3, exam, pct, pos) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(pos), 0) + 1 FROM students))")
+SQLITE_UPDATE = "UPDATE students SET cw1 = ?, cw2 = ?, cw3 = ?, exam = ?, pct = ? WHERE code = ?"
+SQLITE_DELETE = "DELETE FROM students WHERE code = ?"
+
+
+def sqlite_read_only(path):
+    # open a database for reading only, so loading or re-checking a file never changes it
+    return sqlite3.connect(Path(os.path.abspath(path)).as_uri() + "?mode=ro", uri=True)
+
+
+def has_students_table(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'students'").fetchone() is not None
+
+
+def write_marks_sqlite(path, store):
+    # put every student into a database in one transaction (used for exports and full saves)
+    db = sqlite3.connect(path)
+    try:
+        with db:
+            db.executescript(SQLITE_SCHEMA)
+            db.execute("DELETE FROM students")
+            db.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           ((store.codes[rid], store.names[rid], store.cw1[rid], store.cw2[rid],
+                             store.cw3[rid], store.exam[rid], store.pct[rid], pos)
+                            for pos, rid in enumerate(store.order)))
+    finally:
+        db.close()
+
+
+class SqliteBackend:
+    # Students in an SQLite database: code is the primary key and file position is
+    # indexed (for reading in order and MAX(pos) when adding). There's no name index:
+    # the whole table is read into a MarkStore, and searching and sorting use its
+    # in-memory indexes the same as for the other formats, so SQL never looks names
+    # up. Each change is one row in one transaction.
+    def __init__(self, path):
+        self.path = path
+        self.pending = [] # (sql, params) waiting for write()
+        self.snapshot = None
+        self.schema_ready = False # SQLITE_SCHEMA gets run by the first write
+        self.lock = threading.Lock()
+
+    def read(self, cancel):
+        db = sqlite_read_only(self.path)
+        try:
+            if not has_students_table(db):
+                return # no students yet, the first save makes the table
+            total = max(1, db.execute("SELECT COUNT(*) FROM students").fetchone()[0])
+            cur = db.execute("SELECT code, name, cw1, cw2, cw3, exam FROM students ORDER BY pos")
+            done = 0
+            while True:
+                rows = cur.fetchmany(SQLITE_CHUNK_ROWS)
+                if not rows or cancel.is_set():
+                    return
+                done += len(rows)
+                yield ("chunk", (rows, 0, done / total))
+        finally:
+            db.close()
+
+    def after_load(self, store):
+        pass
+
+    def log(self, op, code, *fields):
+        if op == "+":
+            name, cw1, cw2, cw3, exam = fields
+            job = (SQLITE_ADD, (code, name, cw1, cw2, cw3, exam, overall_pct(cw1, cw2, cw3, exam)))
+        elif op == "=":
+            job = (SQLITE_UPDATE, (*fields, overall_pct(*fields), code))
+        elif op == "-":
+            job = (SQLITE_DELETE, (code,))
+        else:
+            return False
+        with self.lock:
+            self.pending.append(job)
+        return False
+
+    def unsaved(self):
+        return False # write() is always queued straight after log()
+
+    def request_save(self, store):
+        snap = store.copy()
+        with self.lock:
+            self.snapshot, self.pending = snap, []
+
+    def write(self):
+        with self.lock:
+            snap, self.snapshot = self.snapshot, None
+            jobs, self.pending = self.pending, []
+        if snap is None and not jobs:
+            return None
+        before = file_signature(self.path)
+        if snap is not None:
+            write_marks_sqlite(self.path, snap)
+        if jobs:
+            db = sqlite3.connect(self.path)
+            try:
+                if not self.schema_ready and snap is None:
+                    db.executescript(SQLITE_SCHEMA)
+                with db: # one transaction for everything that piled up
+                    for sql, params in jobs:
+                        db.execute(sql, params)
+            finally:
+                db.close()
+        self.schema_ready = True
+        return before, file_signature(self.path)
+
+
+def open_backend(path):
+    # pick the storage backend from the file name
+    if path.endswith(SQLITE_EXTS):
+        return SqliteBackend(path)
+    return FileBackend(path)
+
+
+def file_signature(path):
+    # (modified time, size) of a file, None if it isn't there - enough to notice a change
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def diff_stores(old, new):
+    # The changes that turn `old` into `new`, matched up by student code:
+    #   ("+", code, name, cw1, cw2, cw3, exam), ("=", code, cw1, cw2, cw3, exam), ("-", code)
+    # `old` can be a snapshot (MarkStore.copy), only its own arrays are read.
+    old_rows = dict(zip(map(old.codes.__getitem__, old.order), old.order))
+    changes = [("-", code) for code in old_rows if code not in new.by_code]
+    for rid in new.order:
+        code = new.codes[rid]
+        marks = (new.cw1[rid], new.cw2[rid], new.cw3[rid], new.exam[rid])
+        have = old_rows.get(code)
+        if have is None:
+            changes.append(("+", code, new.names[rid], *marks))
+        elif old.names[have] != new.names[rid]:
+            # names can't be edited in place, so it's a delete and an add
+            changes.append(("-", code))
+            changes.append(("+", code, new.names[rid], *marks))
+        elif marks != (old.cw1[have], old.cw2[have], old.cw3[have], old.exam[have]):
+            changes.append(("=", code, *marks))
+    return changes
+
+
+def diff_file(path, old):
+    # read a marks file again and work out what changed compared to the snapshot `old`,
+    # returns (old.version, changes) so the caller can tell if the snapshot is out of date
+    new, _, _ = load_store(path)
+    return old.version, diff_stores(old, new)
+
+
+class EditLog:
+    # Undo and redo for a store. Changes go in as lists in the diff_stores format,
+    #   ("+", code, name, cw1, cw2, cw3, exam), ("=", code, cw1, cw2, cw3, exam), ("-", code)
+    # and each list is applied in one go (see MarkStore.apply_changes) as one undo step.
+    # Undoing doesn't keep copies of the store, it applies the opposite changes,
+    # worked out from the rows just before they were changed. A student brought
+    # back by undoing a delete goes on the end of the file like any new one.
+    def __init__(self, store, limit=UNDO_LIMIT):
+        self.store = store
+        self.undo_steps = deque(maxlen=limit) # (label, opposite changes)
+        self.redo_steps = []
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+
+    def apply(self, changes, label):
+        # apply a batch as a new step, returns (label, changes, row ids) like undo/redo
+        changes, rids, opposite = self._run(changes)
+        self.undo_steps.append((label, opposite))
+        self.redo_steps.clear()
+        return label, changes, rids
+
+    def undo(self):
+        # put the last step back, None if there's nothing to undo
+        if not self.undo_steps:
+            return None
+        label, opposite = self.undo_steps[-1]
+        changes, rids, again = self._run(opposite)
+        self.undo_steps.pop()
+        self.redo_steps.append((label, again))
+        return label, changes, rids
+
+    def redo(self):
+        if not self.redo_steps:
+            return None
+        label, again = self.redo_steps[-1]
+        changes, rids, opposite = self._run(again)
+        self.redo_steps.pop()
+        self.undo_steps.append((label, opposite))
+        return label, changes, rids
+
+    def _run(self, changes):
+        # Check the whole batch first, so a bad change leaves the store as it was
+        # (ValueError), then apply it. Returns the changes with int codes, the row
+        # id each one touched (the deleted row for "-") and the opposite changes.
+        store = self.store
+        fixed, rids, opposite, seen = [], [], [], set()
+        for op, code, *fields in changes:
+            code = int(code)
+            if code in seen:
+                raise ValueError(f"Student {code} is changed twice in one go")
+            seen.add(code)
+            rid = store.by_code.get(code)
+            try:
+                array("h", fields[1:] if op == "+" else fields) # marks that don't fit
+            except (OverflowError, TypeError):
+                raise ValueError(f"Student {code} has marks that aren't small whole numbers") from None
+            if op == "+":
+                if rid is not None:
+                    raise ValueError(f"A student with code {code} already exists")
+                opposite.append(("-", code))
+            elif rid is None:
+                raise ValueError(f"Student {code} isn't in the file any more")
+            elif op == "=":
+                opposite.append(("=", code, store.cw1[rid], store.cw2[rid], store.cw3[rid], store.exam[rid]))
+            elif op == "-":
+                opposite.append(("+", code, store.names[rid], store.cw1[rid], store.cw2[rid],
+                                 store.cw3[rid], store.exam[rid]))
+            else:
+                raise ValueError(f"Unknown change {op!r}")
+            fixed.append((op, code, *fields))
+            rids.append(rid)
+        store.apply_changes(fixed)
+        # new students only get their row ids once they're in
+        rids = [store.by_code[c[1]] if c[0] == "+" else rid for c, rid in zip(fixed, rids)]
+        return fixed, rids, opposite
+
+
+def load_store(path, cancel=None):
+    # Load a whole marks file (any format) in one go, for scripts that don't need
+    # the window's progress bar. Returns (store, backend, bad lines skipped).
+    backend = open_backend(path)
+    store = MarkStore()
+    bad = 0
+    for kind, payload in backend.read(cancel or threading.Event()):
+        if kind == "columns":
+            store.load_columns(*payload)
+            continue
+        rows, skipped, _ = payload
+        bad += skipped + store.add_many(rows)
+    backend.after_load(store)
+    return store, backend, bad
+
+
+def class_summary(store):
+    # one line with the class average and how many got each grade
+    if not store:
+        return "No students."
+    avg = store.average_pct()
+    grades = "  ".join(f"{g}: {n}" for g, n in store.grade_counts.items())
+    return f"Students: {len(store)}    |    Average %: {avg}    |    {grades}"
+
+
+def report_rows(store, rows=None):
+    # one tuple per student with everything worked out, in REPORT_FIELDS order,
+    # built a column at a time rather than a student at a time
+    rows = store.order if rows is None else rows
+    cols = (store.codes, store.names, store.cw1, store.cw2, store.cw3, store.cw_tot, store.exam, store.pct)
+    return zip(*(map(col.__getitem__, rows) for col in cols), map(chr, map(store.grades.__getitem__, rows)))
+
+
+def write_report(path, store, rows=None):
+    # Grade report as CSV or JSON (picked from the file name), rows in file order
+    # unless a list of row ids is given. The JSON one has the class summary on top.
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            summary = {"students": len(store), "average_pct": store.average_pct() if store else None,
+                       "grades": store.grade_counts}
+            if store:
+                summary["highest"] = store.codes[store.best()]
+                summary["lowest"] = store.codes[store.worst()]
+            # written a student at a time so a huge class doesn't need one huge string,
+            # only the name needs json's escaping, the rest are plain numbers
+            f.write('{"summary": ' + json.dumps(summary) + ', "students": [')
+            row = ('\n  {"code": %d, "name": %s, "cw1": %d, "cw2": %d, "cw3": %d, "cw_total": %d, '
+                   '"exam": %d, "pct": %r, "grade": "%s"}')
+            dumps = json.dumps
+            sep = ""
+            for code, name, *rest in report_rows(store, rows):
+                f.write(sep + row % (code, dumps(name), *rest))
+                sep = ","
+            f.write("\n]}\n")
+        else:
+            out = csv.writer(f)
+            out.writerow(REPORT_FIELDS)
+            out.writerows(report_rows(store, rows))
+    os.replace(tmp, path)
+
+
+# --- Cohorts: one marks file per module, merged by student code ---
+# Loading a folder is done in two rounds on a process pool, so nearly all the
+# work is spread over the cores:
+#   1. read_module: each file is read and graded, and its students are split
+#      into `shards` groups by student code
+#   2. merge_shard: each group is merged across every module on its own
+# This process only passes the pieces along and joins the merged groups.
+
+def read_module(path, shards=1):
+    # Returns (file name, (students, average %, {grade: count}), parts, bad lines,
+    # error message), parts[k] being (codes, names, pct) for the students whose
+    # code % shards == k. Arrays, because they pickle as a single block of bytes.
+    name = os.path.basename(path)
+    try:
+        store, _, bad = load_store(path)
+    except Exception as e:
+        return name, None, None, 0, str(e)
+    stats = (len(store), store.average_pct() if store else None, dict(store.grade_counts))
+    parts = [(array("i"), [], array("d")) for _ in range(shards)]
+    codes, names, pct = store.codes, store.names, store.pct
+    for rid in store.order:
+        code = codes[rid]
+        part = parts[code % shards]
+        part[0].append(code)
+        part[1].append(names[rid])
+        part[2].append(pct[rid])
+    return name, stats, parts, bad, None
+
+
+def merge_shard(parts):
+    # one group of students merged across all the modules (parts in module order)
+    cohort = Cohort()
+    for codes, names, pct in parts:
+        cohort.merge(codes, names, pct)
+    return cohort.codes, cohort.names, cohort.taken, cohort.pct_cents, cohort.best, cohort.worst
+
+
+class Cohort:
+    # Students from many module files, one row per student code, plus a summary
+    # per module. Percentages are added up in hundredths like MarkStore does, so
+    # the averages come out exact no matter what order the modules arrive in.
+    def __init__(self):
+        self.modules = [] # (file name, students, average %, {grade: count}, bad lines)
+        self.failed = []  # (file name, error message) for files that couldn't be read
+        self.by_code = {} # student code -> row
+        self.codes = array("i")
+        self.names = []
+        self.taken = array("i")      # how many modules each student is in
+        self.pct_cents = array("q")  # their percentages added up, in hundredths
+        self.best = array("d")
+        self.worst = array("d")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def add_module(self, name, stats, bad, error=None):
+        if error is not None:
+            self.failed.append((name, error))
+        else:
+            self.modules.append((name, *stats, bad))
+
+    def merge(self, codes, names, pct):
+        # add one module's results, the name from the first module a student is in is kept
+        by_code, taken, cents, best, worst = self.by_code, self.taken, self.pct_cents, self.best, self.worst
+        for code, student, p in zip(codes, names, pct):
+            row = by_code.get(code)
+            if row is None:
+                by_code[code] = len(self.codes)
+                self.codes.append(code)
+                self.names.append(sys.intern(student))
+                taken.append(1)
+                cents.append(round(p * 100))
+                best.append(p)
+                worst.append(p)
+            else:
+                taken[row] += 1
+                cents[row] += round(p * 100)
+                if p > best[row]:
+                    best[row] = p
+                if p < worst[row]:
+                    worst[row] = p
+
+    def extend(self, cols):
+        # join on a group of students that were merged elsewhere (see merge_shard)
+        codes, names, taken, cents, best, worst = cols
+        start = len(self.codes)
+        self.by_code.update(zip(codes, range(start, start + len(codes))))
+        self.codes.extend(codes)
+        self.names.extend(map(sys.intern, names))
+        self.taken.extend(taken)
+        self.pct_cents.extend(cents)
+        self.best.extend(best)
+        self.worst.extend(worst)
+
+    def average_pct(self, row):
+        # a student's average over the modules they're in
+        return round(self.pct_cents[row] / 100 / self.taken[row], 2)
+
+    def rows(self):
+        # (code, name, modules, average %, best %, worst %, grade) for everyone, by code
+        for row in sorted(range(len(self.codes)), key=self.codes.__getitem__):
+            avg = self.average_pct(row)
+            yield (self.codes[row], self.names[row], self.taken[row], avg,
+                   self.best[row], self.worst[row], grade_from_pct(avg))
+
+    def summary(self):
+        # cross-module statistics as (label, value) pairs
+        if not self.codes:
+            return [("Modules", len(self.modules)), ("Students", 0)]
+        averages = array("d", map(self.average_pct, range(len(self.codes))))
+        # ties go to the lowest code, so the answer doesn't depend on the merge order
+        top = max(range(len(averages)), key=lambda row: (averages[row], -self.codes[row]))
+        results = sum(self.taken)
+        grade_counts = Counter()
+        for module in self.modules:
+            grade_counts.update(module[3])
+        return [
+            ("Modules", len(self.modules)),
+            ("Students", len(self.codes)),
+            ("In more than one module", sum(1 for t in self.taken if t > 1)),
+            ("Module results", results),
+            ("Average % (all results)", round(sum(self.pct_cents) / 100 / results, 2)),
+            ("Average % (per student)", round(fsum(averages) / len(averages), 2)),
+            ("Best average", f"{self.names[top]} ({self.codes[top]}) - {averages[top]}%"),
+            ("Grades (all results)", "  ".join(f"{g}: {grade_counts[g]}" for g in "ABCDF")),
+        ]
+
+
+def cohort_files(folder):
+    # the marks files in a folder, in name order. Databases without a students
+    # table belong to something else and are left out (and left alone).
+    paths = (os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(COHORT_EXTS))
+    return sorted(path for path in paths if os.path.isfile(path)
+                  and (not path.lower().endswith(SQLITE_EXTS) or is_marks_db(path)))
+
+
+def is_marks_db(path):
+    try:
+        db = sqlite_read_only(path)
+        try:
+            return has_students_table(db)
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return False # not a database at all
+
+
+def load_cohort(paths, workers=None):
+    # Read many module files on a process pool (workers=None is one per core)
+    # and merge them by student code, see the notes above read_module.
+    cohort = Cohort()
+    if workers == 1 or len(paths) < 2:
+        for path in paths:
+            name, stats, parts, bad, error = read_module(path)
+            cohort.add_module(name, stats, bad, error)
+            if parts:
+                cohort.merge(*parts[0])
+        return cohort
+    shards = workers or os.cpu_count() or 1
+    pieces = [[] for _ in range(shards)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+        for name, stats, parts, bad, error in pool.map(read_module, paths, repeat(shards)):
+            cohort.add_module(name, stats, bad, error)
+            for piece, part in zip(pieces, parts or ()):
+                piece.append(part)
+        for cols in pool.map(merge_shard, pieces):
+            cohort.extend(cols)
+    return cohort
+
+
+# --- Bulk import from CSV files (e.g. saved from Excel) ---
+# The file is read in chunks of IMPORT_CHUNK_ROWS rows, and every chunk is checked
+# on a process pool with the same rules as the Add screen. A code that turns up
+# twice can only be caught once the chunks are back, so that check is done here.
+
+def import_problem(code, name, marks):
+    # what's wrong with one student from a CSV file (all strings), None if nothing
+    if not (code.isdigit() and 1000 <= int(code) <= 9999):
+        return "code must be a 4-digit number (1000-9999)"
+    if not name:
+        return "no name"
+    if "," in name or "\n" in name:
+        return "the name has a comma or line break in it" # marks files are one student per line, comma separated
+    try:
+        marks = [int(m) for m in marks]
+    except ValueError:
+        return "marks have to be whole numbers"
+    for label, mark, top in zip(("CW1", "CW2", "CW3", "Exam"), marks, (20, 20, 20, 100)):
+        if not 0 <= mark <= top:
+            return f"{label} must be 0-{top}"
+    return None
+
+
+def check_import_rows(rows, first_line, columns):
+    # Check one chunk of CSV rows (runs on a worker). columns says where code, name,
+    # cw1, cw2, cw3 and exam are in a row. Returns (good, rejected): good rows are
+    # (line, code, name, cw1, cw2, cw3, exam), rejected ones (line, reason, text).
+    good, rejected = [], []
+    width = max(columns) + 1
+    for line, row in enumerate(rows, first_line):
+        if not any(field.strip() for field in row):
+            continue # empty rows, spreadsheets often end with a few
+        if len(row) < width:
+            rejected.append((line, f"expected {width} columns, found {len(row)}", ",".join(row)))
+            continue
+        code, name, *marks = (row[i].strip() for i in columns)
+        problem = import_problem(code, name, marks)
+        if problem:
+            rejected.append((line, problem, ",".join(row)))
+        else:
+            good.append((line, int(code), name, *map(int, marks)))
+    return good, rejected
+
+
+def import_columns(first):
+    # Where each column is, from the first row of a CSV file. Returns (columns,
+    # has_header): a row of headers is matched against IMPORT_HEADERS, a row
+    # starting with a student code means there's no header and the columns are
+    # in marks-file order (code, name, cw1, cw2, cw3, exam).
+    if first and first[0].strip().isdigit():
+        return list(range(6)), False
+    names = ["".join(ch for ch in field.lower() if ch.isalnum()) for field in first]
+    columns, missing = [], []
+    for col, aliases in IMPORT_HEADERS.items():
+        found = [i for i, name in enumerate(names) if name in aliases]
+        if found:
+            columns.append(found[0])
+        else:
+            missing.append(col)
+    if missing:
+        raise ValueError(f"couldn't find the {', '.join(missing)} column{'s' if len(missing) > 1 else ''} "
+                         f"in the header row: {','.join(first)}")
+    return columns, True
+
+
+def read_import_csv(path, workers=None):
+    # Read and check a whole CSV file (workers=None is one process per core).
+    # Returns (good, rejected) like check_import_rows, both in file order, with
+    # a repeated student code rejected everywhere after its first row.
+    with open(path, newline="", encoding="utf-8-sig") as f: # utf-8-sig drops Excel's BOM
+        try:
+            dialect = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        first = next(reader, None)
+        if first is None:
+            return [], []
+        columns, has_header = import_columns(first)
+        rows = reader if has_header else chain([first], reader)
+        line = 2 if has_header else 1
+        chunk = list(islice(rows, IMPORT_CHUNK_ROWS))
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(chunk) < IMPORT_CHUNK_ROWS:
+            # one core, or only one chunk - starting processes would take longer than checking it
+            parts = [check_import_rows(chunk, line, columns)]
+            while len(chunk) == IMPORT_CHUNK_ROWS:
+                line += len(chunk)
+                chunk = list(islice(rows, IMPORT_CHUNK_ROWS))
+                parts.append(check_import_rows(chunk, line, columns))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+                # the workers check chunks while this process is still reading the next ones
+                jobs = []
+                while chunk:
+                    jobs.append(pool.submit(check_import_rows, chunk, line, columns))
+                    line += len(chunk)
+                    chunk = list(islice(rows, IMPORT_CHUNK_ROWS))
+                parts = [job.result() for job in jobs]
+    good, rejected, first_seen = [], [], {}
+    for rows_ok, rows_bad in parts:
+        rejected.extend(rows_bad)
+        for row in rows_ok:
+            line, code = row[0], row[1]
+            if code in first_seen:
+                rejected.append((line, f"code {code} is already on line {first_seen[code]}",
+                                 ",".join(map(str, row[1:]))))
+            else:
+                first_seen[code] = line
+                good.append(row)
+    rejected.sort()
+    return good, rejected
+
+
+def import_changes(store, rows, update=True):
+    # Turn checked rows into changes for EditLog.apply (or store.apply_changes):
+    # new codes are added, and students already in the store get the new marks -
+    # or are rejected when update is False, like the Add screen does. A code that
+    # belongs to someone with another name is always rejected. Returns (changes, rejected).
+    changes, rejected = [], []
+    by_code, names = store.by_code, store.names
+    for line, code, name, *marks in rows:
+        rid = by_code.get(code)
+        if rid is None:
+            changes.append(("+", code, name, *marks))
+            continue
+        if not update:
+            problem = f"a student with code {code} already exists"
+        elif names[rid].lower() != name.lower():
+            problem = f"code {code} belongs to {names[rid]}"
+        else:
+            if tuple(marks) != (store.cw1[rid], store.cw2[rid], store.cw3[rid], store.exam[rid]):
+                changes.append(("=", code, *marks))
+            continue
+        rejected.append((line, problem, ",".join(map(str, (code, name, *marks)))))
+    return changes, rejected
+
+
+def write_rejects(path, rejected):
+    # the rows an import left out, as a CSV file someone can fix and import again
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow(["line", "reason", "row"])
+        out.writerows(rejected)
@@ -1,10 +1,194 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog, filedialog
+from tkinter import ttk, messagebox, filedialog
+from collections import deque
+import cProfile
+from functools import wraps
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from marks_core import (BIN_EXT, EditLog, MarkStore, class_summary, cohort_files, diff_file, file_signature,
+                        import_changes, load_cohort, open_backend, read_import_csv, write_marks_bin,
+                        write_marks_sqlite, write_marks_text, write_rejects, write_report)
+
 
 # This is where the student data file is supposed to be
 DATA_FILE = r"C:\Users\HP\Desktop\studentMarks.txt"
 
+# height of one table row in pixels (the Treeview styles use this too)
+ROW_HEIGHT = 26
+# extra rows drawn below the visible area so partly shown rows aren't blank
+OVERSCAN = 2
+
+# how often (ms) the window checks for loaded chunks, and how long it may spend on them
+LOAD_POLL_MS = 30
+LOAD_BUDGET_S = 0.03
+# background threads for saving, sorting and the summary, and how often (ms)
+# the window checks for their results
+WORKERS = 2
+TASK_POLL_MS = 20
+
+# how often (ms) the open marks file is checked for changes made by other programs
+WATCH_MS = 1000
+
+# how many recent timings are kept for the overlay and Tools > Save timings
+TIMINGS_KEPT = 500
+# how often (ms) the timing overlay updates while it's showing
+OVERLAY_MS = 500
+
+# the search box waits this long (ms) after the last key press before searching
+SEARCH_DELAY_MS = 120
+
+# names listed in the "delete these students?" question before it says "and N more"
+CONFIRM_NAMES = 8
+# event.state bits for Shift and Control, held down they add to the selection
+EXTEND_SELECT_MASK = 0x0001 | 0x0004
+# rejected rows listed after a CSV import (the rest can be saved to a file)
+REJECTS_SHOWN = 10
+# how many students the Rankings view lists at each end to begin with, and at most
+RANKINGS_N = 10
+RANKINGS_MAX = 1000
+
+MARKS_FILETYPES = [("Marks files", "*.txt *" + BIN_EXT + " *.db *.sqlite"), ("Text files", "*.txt"),
+                   ("Binary marks files", "*" + BIN_EXT), ("SQLite databases", "*.db *.sqlite"),
+                   ("All files", "*.*")]
+
+
+class Timings:
+    # How long the slow parts took lately - loading, saving, drawing the table,
+    # sorting, searching, the summary - with how many students there were at the
+    # time. Background jobs add to it too, so add() can be called from any thread.
+    def __init__(self, keep=TIMINGS_KEPT):
+        self.t0 = time.perf_counter()
+        self.recent = deque(maxlen=keep) # (start, what, seconds, students, thread id)
+        self.totals = {} # what -> [calls, total seconds, slowest]
+        self.lock = threading.Lock()
+
+    def add(self, what, start, seconds, students=None):
+        with self.lock:
+            self.recent.append((start, what, seconds, students, threading.get_ident()))
+            calls = self.totals.setdefault(what, [0, 0.0, 0.0])
+            calls[0] += 1
+            calls[1] += seconds
+            calls[2] = max(calls[2], seconds)
+
+    def lines(self):
+        # one line per kind of timing: the latest, the average and the slowest
+        with self.lock:
+            latest = {what: (seconds, students) for _, what, seconds, students, _ in self.recent}
+            totals = {what: list(t) for what, t in self.totals.items()}
+        out = []
+        for what in sorted(totals):
+            calls, total, slowest = totals[what]
+            seconds, students = latest.get(what, (0.0, None))
+            n = f"  ({students} students)" if students is not None else ""
+            out.append(f"{what:<9} last {seconds * 1000:8.1f} ms   avg {total / calls * 1000:8.1f} ms   "
+                       f"max {slowest * 1000:8.1f} ms   x{calls}{n}")
+        return out
+
+    def dump(self, path):
+        # the recent timings in Chrome's trace format (chrome://tracing or ui.perfetto.dev
+        # can open it), with the totals alongside for a quick look
+        with self.lock:
+            recent, totals = list(self.recent), {what: list(t) for what, t in self.totals.items()}
+        events = [{"name": what, "ph": "X", "pid": os.getpid(), "tid": tid,
+                   "ts": round((start - self.t0) * 1e6), "dur": round(seconds * 1e6),
+                   "args": {} if students is None else {"students": students}}
+                  for start, what, seconds, students, tid in recent]
+        summary = {what: {"calls": c, "total_s": t, "max_s": m} for what, (c, t, m) in totals.items()}
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"totals": summary}}, f, indent=1)
+
+
+def timed(what):
+    # decorator for DarkMarksApp methods: every call goes into self.timings
+    def wrap(fn):
+        @wraps(fn)
+        def method(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                self.timings.add(what, start, time.perf_counter() - start, len(self.records))
+        return method
+    return wrap
+
+
+class TaskRunner:
+    # Runs slow jobs (saving, sorting, the summary) on a small thread pool and hands
+    # the results back on the Tk thread, because widgets may only be touched there.
+    # Jobs given the same `key` are coalesced: while one is running, only the
+    # newest one waiting behind it is kept.
+    def __init__(self, root, workers=WORKERS, timings=None):
+        self.root = root
+        self.timings = timings # background jobs are timed under their key (or function name)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.results = queue.Queue()
+        self.running = set()
+        self.waiting = {}
+        self.root.after(TASK_POLL_MS, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None):
+        job = (fn, args, on_done, on_error)
+        if key is not None:
+            if key in self.running:
+                self.waiting[key] = job # replaces anything already waiting
+                return
+            self.running.add(key)
+        self._start(key, job)
+
+    def _start(self, key, job):
+        fn, args, on_done, on_error = job
+        def run():
+            start = time.perf_counter()
+            try:
+                self.results.put((key, on_done, fn(*args), None))
+            except Exception as e:
+                self.results.put((key, on_error, None, e))
+            if self.timings:
+                self.timings.add(key or getattr(fn, "__name__", "task"), start, time.perf_counter() - start)
+        self.pool.submit(run)
+
+    def busy(self, key):
+        # is a job with this key running (or waiting to)?
+        return key in self.running
+
+    def _poll(self):
+        # runs on the Tk thread: call back with whatever the workers finished.
+        # The next poll is booked first so a callback that fails can't stop polling.
+        self.root.after(TASK_POLL_MS, self._poll)
+        while True:
+            try:
+                key, callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if key is not None:
+                self.running.discard(key)
+                job = self.waiting.pop(key, None)
+                if job:
+                    self.running.add(key)
+                    self._start(key, job)
+            if error is not None and callback is None:
+                messagebox.showerror("Error", str(error))
+            elif callback is not None:
+                try:
+                    callback(error if error is not None else result)
+                except Exception as e:
+                    messagebox.showerror("Error", str(e)) # and carry on with the rest
+
+    def finish(self):
+        # wait for the running jobs and do the waiting ones right here (used when quitting)
+        self.pool.shutdown(wait=True)
+        jobs, self.waiting = list(self.waiting.values()), {}
+        for fn, args, on_done, on_error in jobs:
+            try:
+                fn(*args)
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+
 
 class DarkMarksApp:
     def __init__(self, root: tk.Tk):
@@ -17,26 +201,60 @@ class DarkMarksApp:
         self.root.configure(bg="#0f1724")
 
         # variables for keeping track of data
-        self.records = []  # list of student dictionaries
+        self.records = MarkStore()  # all the students, see MarkStore
+        self.history = EditLog(self.records) # undo/redo for every add, edit and delete
         self.desc_toggle = False
+        self.sort_key = None # column the table is sorted by, None for file order
+        # live search - the text in the search box and the row ids it matched
+        self.search_text = ""
+        self.filter_rows = None
+        self.search_job = None
+        self.filters = {} # the Filter dialog's choices, as keyword arguments for MarkStore.query
         self.current_path = None
-
-        # load data and set up UI components
-        self._locate_and_load()
+        self.backend = None # FileBackend or SqliteBackend for current_path
+        self.loading = False
+        self.watch_sig = None # file_signature of current_path as we last read it
+        # the table only holds the rows you can see, this is the first one shown
+        self.view_top = 0
+        self.selected_codes = set() # codes of the selected students, so scrolling keeps them highlighted
+        self.extend_select = False # was the last click a ctrl/shift-click
+        self.list_shown = False # is the list view on screen (it's hidden, not destroyed, otherwise)
+        self.list_stale = False # did it miss a redraw while hidden
+        self.shown = [] # row ids in the Treeview's items, top to bottom
+        self.restripe_job = None
+
+        # set up UI components, then load the data in the background
+        self.timings = Timings()
+        self.profiler = None # a cProfile.Profile while Tools > Start profiling is on
+        self.overlay = None  # the timing overlay label, while it's showing
+        self.tasks = TaskRunner(self.root, timings=self.timings)
         self._style_setup()
         self._build_ui()
         self._apply_theme("dark") # make sure the colors are right when starting
         self.show_list_view()
         self._set_status("Ready")
+        self._locate_and_load()
+        self.root.after(WATCH_MS, self._watch_file)
+        # write any waiting changes when the window is closed
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
     # --- File Handlers ---
     def _locate_and_load(self):
         # try to find the data file and load it
         path = self._find_data_file()
         if path:
-            self.current_path = path
+            self._use_file(path)
             self._load_from_file(path)
 
+    def _use_file(self, path):
+        try:
+            self.backend = open_backend(path)
+            self.current_path = path
+            self.watch_sig = None
+        except Exception as e:
+            self.backend = self.current_path = None
+            messagebox.showerror("Load Error", f"Uh oh, couldn't open the file:\n{e}")
+
     def _find_data_file(self):
         # check the default path first
         if os.path.exists(DATA_FILE):
@@ -54,94 +272,366 @@ class DarkMarksApp:
                                "Couldn't find studentMarks.txt. Gotta select it manually.")
         chosen = filedialog.askopenfilename(
             title="Select studentMarks.txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=MARKS_FILETYPES
         )
         return chosen or None
 
+    def _open_dialog(self):
+        # File > Open: switch to another marks file (text, binary or SQLite)
+        if not self._check_not_loading():
+            return
+        path = filedialog.askopenfilename(title="Open marks file", filetypes=MARKS_FILETYPES)
+        if not path:
+            return
+        self._flush_backend() # get the old file up to date before letting go of it
+        self._use_file(path)
+        if not self.backend:
+            return
+        self.search_text = ""
+        self.filter_rows = None
+        self.filters = {}
+        if hasattr(self, "search_var"):
+            self.search_var.set("")
+            self.filter_label.configure(text="Showing everyone")
+        self._load_from_file(path)
+
+    def _export_dialog(self, kind):
+        # File > Export: write a copy in another format, the open file stays as it is
+        if not self._check_not_loading():
+            return
+        if kind == "binary":
+            path = filedialog.asksaveasfilename(title="Export binary marks file", defaultextension=BIN_EXT,
+                                                filetypes=[("Binary marks files", "*" + BIN_EXT)])
+            writer = write_marks_bin
+        elif kind == "sqlite":
+            path = filedialog.asksaveasfilename(title="Export SQLite database", defaultextension=".db",
+                                                filetypes=[("SQLite databases", "*.db *.sqlite")])
+            writer = write_marks_sqlite
+        elif kind == "report":
+            path = filedialog.asksaveasfilename(title="Export grade report", defaultextension=".csv",
+                                                filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json")])
+            writer = write_report
+        else:
+            path = filedialog.asksaveasfilename(title="Export marks as text", defaultextension=".txt",
+                                                filetypes=[("Text files", "*.txt")])
+            writer = write_marks_text
+        if not path:
+            return
+        self.tasks.submit(writer, path, self.records.copy(),
+                          on_done=lambda r: self._set_status(f"Exported {os.path.basename(path)}"),
+                          on_error=self._on_save_error)
+
+    def _import_dialog(self):
+        # File > Import: add (or update) the students in a CSV file, e.g. one saved from
+        # Excel. It's read and checked on the worker processes, see read_import_csv.
+        if not self._check_not_loading():
+            return
+        if not self.backend:
+            messagebox.showerror("Import Error", "Open a marks file to import the students into first.")
+            return
+        path = filedialog.askopenfilename(title="Import students from CSV",
+                                          filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        self._set_status(f"Checking {os.path.basename(path)}...")
+        self.tasks.submit(read_import_csv, path, on_done=lambda result: self._import_checked(path, *result),
+                          on_error=lambda e: messagebox.showerror("Import Error", f"Couldn't read the file:\n{e}"),
+                          key="import")
+
+    def _import_checked(self, path, rows, rejected):
+        # everything that passed goes in as one change: one save and one undo step
+        if self.loading:
+            return
+        name = os.path.basename(path)
+        changes, more = import_changes(self.records, rows)
+        updates = sum(1 for change in changes if change[0] == "=")
+        if updates:
+            answer = messagebox.askyesnocancel(
+                "Import", f"{updates} of the students in {name} are already here with different marks.\n"
+                          "Update their marks? (No only adds the new students.)")
+            if answer is None:
+                self._set_status("Import cancelled")
+                return
+            if not answer:
+                changes, more = import_changes(self.records, rows, update=False)
+        rejected = sorted(rejected + more)
+        if changes and not self._apply_edits(changes, f"import {name}", "Import Error"):
+            return
+        added = sum(1 for change in changes if change[0] == "+")
+        summary = f"Imported {name}: {added} added, {len(changes) - added} updated, {len(rejected)} rejected"
+        self._set_status(summary)
+        if not rejected:
+            return
+        shown = [f"line {line}: {reason}" for line, reason, _ in rejected[:REJECTS_SHOWN]]
+        if len(rejected) > REJECTS_SHOWN:
+            shown.append(f"...and {len(rejected) - REJECTS_SHOWN} more")
+        if not messagebox.askyesno("Import", summary + ".\n\n" + "\n".join(shown) +
+                                   "\n\nSave the rejected rows to a file so they can be fixed?"):
+            return
+        out = filedialog.asksaveasfilename(title="Save rejected rows", defaultextension=".csv",
+                                           filetypes=[("CSV files", "*.csv")])
+        if out:
+            try:
+                write_rejects(out, rejected)
+            except OSError as e:
+                messagebox.showerror("Save Error", f"Couldn't save the rejected rows:\n{e}")
+
     def _load_from_file(self, path):
+        # start reading the file on a background thread, _poll_load picks up the pieces
         self.records.clear()
-        bad = 0 # counter for corrupted lines
+        self.history.clear()
+        self._update_undo_menu()
+        self.view_top = 0
+        self.sort_key = None # show file order while loading, indexes get built later
+        self.desc_toggle = False
+        self.load_bad = 0
+        self.load_name = os.path.basename(path)
+        self.load_queue = queue.Queue(maxsize=8)
+        self.load_cancel = threading.Event()
+        self.loading = True
+        self.load_started = time.perf_counter()
+        # taken before reading, so a change made while we read still gets noticed
+        self.watch_sig = file_signature(path)
+        self.tasks.submit(self._load_worker, self.backend, self.load_queue, self.load_cancel)
+
+        # a cancel button in the status bar while loading (Esc works too)
+        self.cancel_btn = tk.Button(self.status, text="Cancel", relief="flat", padx=8,
+                                    command=self._cancel_load)
+        self.cancel_btn.pack(side="right")
+        self.root.bind("<Escape>", lambda e: self._cancel_load())
+        self.root.after(LOAD_POLL_MS, self._poll_load)
+
+    def _load_worker(self, backend, q, cancel):
+        # runs on the background thread - only parses, never touches the widgets or the store
+        def put(item):
+            while not cancel.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
         try:
-            with open(path, "r") as f:
-                content = f.readlines()
-            if not content:
-                return
-            
-            # handle the optional student count line at the top
+            for item in backend.read(cancel):
+                put(item)
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+
+    def _poll_load(self):
+        # move parsed chunks into the store without hogging the event loop
+        if not self.loading:
+            return
+        deadline = time.perf_counter() + LOAD_BUDGET_S
+        while time.perf_counter() < deadline:
             try:
-                count = int(content[0].strip())
-                lines = content[1:1+count]
-            except Exception:
-                lines = content
-
-            for ln in lines:
-                ln = ln.strip()
-                if not ln:
-                    continue
-                parts = ln.split(",")
-                if len(parts) != 6:
-                    bad += 1
-                    continue
-                code, name, a, b, c, exam = parts
+                kind, payload = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "chunk":
+                rows, bad, done = payload
+                # the whole chunk is graded in one go, anything skipped had a huge
+                # number or the same student code twice
+                self.load_bad += bad + self.records.add_many(rows)
+                pct = min(100, int(done * 100))
+                self._set_status(f"Loading {self.load_name}... {pct}% ({len(self.records)} students) - Esc to cancel")
+            elif kind == "columns":
                 try:
-                    # convert strings to the right types
-                    rec = {
-                        "code": code.strip(),
-                        "name": name.strip(),
-                        "cw1": int(a),
-                        "cw2": int(b),
-                        "cw3": int(c),
-                        "exam": int(exam)
-                    }
-                except ValueError:
-                    bad += 1 # not a number, skip this line
-                    continue
-                self.records.append(rec)
-            
-            if bad:
-                messagebox.showwarning("Data Warning", f"{bad} lines looked wrong and were ignored.")
-        except Exception as e:
-            messagebox.showerror("Load Error", f"Uh oh, couldn't read the file:\n{e}")
+                    self.records.load_columns(*payload)
+                except ValueError as e:
+                    self._load_failed(e)
+                    return
+            elif kind == "done":
+                self._finish_load()
+                return
+            else:
+                self._load_failed(payload)
+                return
+        self._populate_tree()
+        self.root.after(LOAD_POLL_MS, self._poll_load)
 
+    def _finish_load(self):
+        self._stop_loading()
+        try:
+            self.backend.after_load(self.records)
+        except Exception as e:
+            messagebox.showerror("Load Error", f"Couldn't read the journal:\n{e}")
+        # from starting the read to the last chunk going in, journal included
+        self.timings.add("load", self.load_started, time.perf_counter() - self.load_started, len(self.records))
+        self._refresh_list()
+        self._set_status(f"Loaded {len(self.records)} students")
+        if self.load_bad:
+            messagebox.showwarning("Data Warning", f"{self.load_bad} lines looked wrong and were ignored.")
+
+    def _cancel_load(self):
+        # stop loading - half a file must never be saved over the real one, so drop it
+        if not self.loading:
+            return
+        self.load_cancel.set()
+        self._stop_loading()
+        self.records.clear()
+        self.current_path = None
+        self.backend = None
+        self._refresh_list()
+        self._set_status("Loading cancelled")
+
+    def _load_failed(self, error):
+        # drop the file like a cancel, so nothing half-loaded gets saved over it
+        self._cancel_load()
+        self._set_status("Couldn't load the file")
+        messagebox.showerror("Load Error", f"Uh oh, couldn't read the file:\n{error}")
+
+    def _stop_loading(self):
+        self.loading = False
+        self.cancel_btn.destroy()
+        self.root.unbind("<Escape>")
+
+    def _check_not_loading(self):
+        # changes have to wait until the whole file is in
+        if self.loading:
+            messagebox.showinfo("Loading", "Still loading the file, hang on a sec.")
+            return False
+        return True
+
+    @timed("snapshot") # the window's part of a save, the writing itself is timed as "save"
     def _save_to_file(self):
-        # save the current records back to the file
+        # save the current records back to the file (on a worker thread)
+        if not self.backend:
+            messagebox.showerror("Save Error", "Can't save, no file was selected.")
+            return
+        self.backend.request_save(self.records)
+        self._write_backend(self._on_saved)
+
+    def _record_changes(self, changes):
+        # save a batch of changes - journal lines or database rows, or the whole file
+        # if it's time - with one write however many students it touched
+        if not self.backend:
+            self._save_to_file()
+            return
+        due = [self.backend.log(*fields) for fields in changes] # log them all, then decide
+        if any(due):
+            self.backend.request_save(self.records)
+        self._write_backend(self._on_saved)
+
+    def _write_backend(self, on_done=None):
+        # write whatever the backend has waiting, on a worker
         path = self.current_path
+        def written(sigs):
+            # remember what our own save left on disk so the watcher doesn't re-read
+            # it - unless someone else changed the file since we last looked
+            if sigs is not None and path == self.current_path and sigs[0] == self.watch_sig:
+                self.watch_sig = sigs[1]
+            if on_done:
+                on_done()
+        self.tasks.submit(self.backend.write, on_done=written, on_error=self._on_save_error, key="save")
+
+    def _on_saved(self):
+        self._set_status("Saved changes.")
+
+    def _on_save_error(self, e):
+        messagebox.showerror("Save Error", f"Something went wrong saving the file:\n{e}")
+
+    def _flush_backend(self):
+        # queue a compaction if there are journaled changes not in the marks file yet
+        if self.backend and self.backend.unsaved():
+            self.backend.request_save(self.records)
+            self._write_backend()
+
+    def _watch_file(self):
+        # Check if another program changed the marks file. If it did, it's read
+        # again on a worker and compared with a snapshot of what we have, and only
+        # the students that differ are changed here (see diff_file).
+        self.root.after(WATCH_MS, self._watch_file)
+        path = self.current_path
+        # while our own changes are being written the file isn't settled yet
+        if not path or self.loading or self.tasks.busy("save") or self.tasks.busy("watch"):
+            return
+        sig = file_signature(path)
+        if sig is None or sig == self.watch_sig:
+            return
+        records = self.records
+        self.tasks.submit(diff_file, path, records.copy(),
+                          on_done=lambda result: self._apply_file_changes(path, records, sig, result),
+                          on_error=lambda e: self._watch_failed(sig, e), key="watch")
+
+    def _apply_file_changes(self, path, records, sig, result):
+        version, changes = result
+        if path != self.current_path or records is not self.records or version != records.version or self.loading:
+            return # we changed something meanwhile, the next check compares again
+        self.watch_sig = sig
+        if not changes:
+            return # our own save, or nothing that matters
+        records.apply_changes(changes)
+        # our undo steps were worked out against the old file, they might not fit any more
+        self.history.clear()
+        self._update_undo_menu()
+        self._refresh_list()
+        self._set_status(f"{os.path.basename(path)} was changed by another program - "
+                         f"{len(changes)} change{'s' if len(changes) != 1 else ''} loaded")
+
+    def _watch_failed(self, sig, e):
+        # probably caught half written - it gets another look when it changes again
+        self.watch_sig = sig
+        self._set_status(f"Couldn't re-read the marks file: {e}")
+
+    # --- Timings and profiling ---
+    def _toggle_overlay(self):
+        # a small box over the bottom right corner with the latest timings
+        if self.overlay is not None:
+            self.overlay.destroy()
+            self.overlay = None
+            self.tools_menu.entryconfigure(0, label="Show timings")
+            return
+        self.overlay = tk.Label(self.root, justify="left", anchor="nw", font=("Consolas", 9),
+                                bg="#000000", fg="#7ef0a6", padx=8, pady=6)
+        self.overlay.place(relx=1.0, rely=1.0, x=-12, y=-36, anchor="se")
+        self.tools_menu.entryconfigure(0, label="Hide timings")
+        self._update_overlay()
+
+    def _update_overlay(self):
+        if self.overlay is None:
+            return
+        lines = [f"{len(self.records)} students, showing {len(self.shown)} rows"]
+        lines += self.timings.lines() or ["nothing timed yet"]
+        self.overlay.configure(text="\n".join(lines))
+        self.overlay.lift()
+        self.root.after(OVERLAY_MS, self._update_overlay)
+
+    def _save_timings(self):
+        path = filedialog.asksaveasfilename(title="Save timings", defaultextension=".json",
+                                            filetypes=[("JSON trace", "*.json")])
         if not path:
-            messagebox.showerror("Save Error", "Can't save, no file was selected.")
             return
         try:
-            with open(path, "w") as f:
-                # write the number of records first
-                f.write(str(len(self.records)) + "\n")
-                # write each record as a comma-separated line
-                for r in self.records:
-                    line = f"{r['code']},{r['name']},{r['cw1']},{r['cw2']},{r['cw3']},{r['exam']}\n"
-                    f.write(line)
-            self._set_status("Saved changes.")
-        except Exception as e:
-            messagebox.showerror("Save Error", f"Something went wrong saving the file:\n{e}")
-
-    # --- Calculations ---
-    def _cw_total(self, r):
-        # calculate total coursework score (out of 60)
-        return r["cw1"] + r["cw2"] + r["cw3"]
-
-    def _overall_pct(self, r):
-        # calculate overall percentage (total / 160)
-        total = self._cw_total(r) + r["exam"]
-        return round((total / 160) * 100, 2)
-
-    def _grade_from_pct(self, pct):
-        # simple grading logic based on percentage
-        if pct >= 70:
-            return "A"
-        if pct >= 60:
-            return "B"
-        if pct >= 50:
-            return "C"
-        if pct >= 40:
-            return "D"
-        return "F"
+            self.timings.dump(path)
+            self._set_status(f"Saved timings to {os.path.basename(path)} (open it in chrome://tracing)")
+        except OSError as e:
+            messagebox.showerror("Save Error", f"Couldn't save the timings:\n{e}")
+
+    def _toggle_profiler(self):
+        # cProfile everything the window does until it's switched off again, then save
+        # the stats for pstats/snakeviz (background threads aren't included)
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.tools_menu.entryconfigure(2, label="Stop profiling and save...")
+            self._set_status("Profiling - use Tools > Stop profiling when you're done")
+            return
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        self.tools_menu.entryconfigure(2, label="Start profiling")
+        path = filedialog.asksaveasfilename(title="Save profile", defaultextension=".prof",
+                                            filetypes=[("cProfile stats", "*.prof")])
+        if path:
+            profiler.dump_stats(path)
+            self._set_status(f"Saved profile to {os.path.basename(path)}")
+
+    def _on_close(self):
+        # write everything into the marks file before quitting
+        if self.loading:
+            self._cancel_load()
+        self._flush_backend()
+        self.tasks.finish()
+        self.root.destroy()
 
     # --- UI Styling and Theme Toggling ---
     def _style_setup(self):
@@ -153,7 +643,7 @@ class DarkMarksApp:
                         background="#0b1220",
                         foreground="#e6eef6",
                         fieldbackground="#0b1220",
-                        rowheight=26,
+                        rowheight=ROW_HEIGHT,
                         font=("Segoe UI", 10))
         style.configure("Dark.Treeview.Heading",
                         background="#0b1220",
@@ -183,7 +673,7 @@ class DarkMarksApp:
                         background="#ffffff",
                         foreground="#333333",
                         fieldbackground="#ffffff",
-                        rowheight=26,
+                        rowheight=ROW_HEIGHT,
                         font=("Segoe UI", 10))
         style.configure("Bright.Treeview.Heading",
                         background="#e0e0e0",
@@ -245,9 +735,11 @@ class DarkMarksApp:
             self.current_theme = "bright"
             self.theme_btn.configure(text="🌙 Dark Mode")
         
-        # force the list view to reload with the new colors
-        if hasattr(self, 'tree'):
-             self.show_list_view()
+        # recolour the list view in place, and go back to it like before
+        if hasattr(self, "list_frame"):
+            self._style_list_view()
+            if not self.list_shown:
+                self.show_list_view()
 
     def _toggle_theme(self):
         # simply switch between the two themes
@@ -256,6 +748,43 @@ class DarkMarksApp:
 
 
     def _build_ui(self):
+        # File menu for opening and converting marks files
+        menubar = tk.Menu(self.root)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Open...", command=self._open_dialog)
+        file_menu.add_command(label="Import students from CSV...", command=self._import_dialog)
+        file_menu.add_command(label="Export as text...", command=lambda: self._export_dialog("text"))
+        file_menu.add_command(label="Export as binary...", command=lambda: self._export_dialog("binary"))
+        file_menu.add_command(label="Export as SQLite...", command=lambda: self._export_dialog("sqlite"))
+        file_menu.add_command(label="Export grade report...", command=lambda: self._export_dialog("report"))
+        file_menu.add_separator()
+        file_menu.add_command(label="Cohort statistics from a folder...", command=self._cohort_dialog)
+        file_menu.add_separator()
+        file_menu.add_command(label="Quit", command=self._on_close)
+        menubar.add_cascade(label="File", menu=file_menu)
+        # Edit menu - undo/redo, and changes to everyone the search found at once
+        self.edit_menu = tk.Menu(menubar, tearoff=0)
+        self.edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self._undo)
+        self.edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self._redo)
+        self.edit_menu.add_separator()
+        self.edit_menu.add_command(label="Edit marks of search results...",
+                                   command=lambda: self._edit_many(self.filter_rows))
+        self.edit_menu.add_command(label="Delete search results...",
+                                   command=lambda: self._delete_many(self.filter_rows))
+        menubar.add_cascade(label="Edit", menu=self.edit_menu)
+        self.root.bind("<Control-z>", lambda e: self._undo())
+        self.root.bind("<Control-y>", lambda e: self._redo())
+        self.root.bind("<Control-Z>", lambda e: self._redo()) # Ctrl+Shift+Z
+        self._update_undo_menu()
+        # Tools menu for seeing where the time goes
+        self.tools_menu = tk.Menu(menubar, tearoff=0)
+        self.tools_menu.add_command(label="Show timings", accelerator="F12", command=self._toggle_overlay)
+        self.tools_menu.add_command(label="Save timings as JSON...", command=self._save_timings)
+        self.tools_menu.add_command(label="Start profiling", command=self._toggle_profiler)
+        menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.root.bind("<F12>", lambda e: self._toggle_overlay())
+        self.root.configure(menu=menubar)
+
         # setup the left sidebar panel
         self.sidebar = tk.Frame(self.root, width=220)
         self.sidebar.pack(side="left", fill="y")
@@ -274,10 +803,12 @@ class DarkMarksApp:
             ("Find", self._search_dialog),
             ("Highest", self._show_extreme_max),
             ("Lowest", self._show_extreme_min),
+            ("Rankings", self._rankings_view),
+            ("Statistics", self._stats_view),
             ("Sort", self._sort_dialog),
             ("Add", self._add_view),
-            ("Edit (select row)", self._edit_selected),
-            ("Delete (select row)", self._delete_selected),
+            ("Edit (select rows)", self._edit_selected),
+            ("Delete (select rows)", self._delete_selected),
         ]
         for txt, cmd in btn_specs:
             b = ttk.Button(self.sidebar, text=txt, style="Dark.Side.TButton", command=cmd)
@@ -306,26 +837,75 @@ class DarkMarksApp:
         self.status_var.set(txt)
 
     def _clear_main(self):
-        # remove all widgets from the main content area
+        # remove all widgets from the main content area - apart from the list view,
+        # which is only hidden so coming back to it doesn't build it all again
+        self.list_shown = False
         for w in self.main.winfo_children():
-            w.destroy()
+            if w is getattr(self, "list_frame", None):
+                w.pack_forget()
+            else:
+                w.destroy()
 
     # --- List/Table View (The main screen) ---
-    def show_list_view(self):
+    # The list view's widgets are made once and kept: other views just hide them,
+    # and a theme change restyles them in place (see _style_list_view).
+    def show_list_view(self, refresh=True):
+        # refresh=False is for coming back after an add/edit/delete that already
+        # updated its own row (see _row_added and friends)
         self._clear_main()
-        hdr = ttk.Label(self.main, text="All Students", style=self.header_style)
-        hdr.pack(anchor="w", padx=18, pady=(14, 6))
+        if not hasattr(self, "list_frame"):
+            self._build_list_view()
+        self.list_frame.pack(fill="both", expand=True)
+        self.list_shown = True
+        if refresh or self.list_stale:
+            self._populate_tree()
+            # the data may have changed since the last search, so run it again
+            if self.search_text or self.filters:
+                self._run_search()
+        self._refresh_summary()
+        self._set_status("Showing all students")
 
-        sub = ttk.Label(self.main, text="CW (3x20), Exam (100). Double-click for details.",
-                        style=self.sub_style)
-        sub.pack(anchor="w", padx=18, pady=(0, 8))
+    def _build_list_view(self):
+        self.list_frame = tk.Frame(self.main)
+        self.list_hdr = ttk.Label(self.list_frame, text="All Students")
+        self.list_hdr.pack(anchor="w", padx=18, pady=(14, 6))
+
+        self.list_sub = ttk.Label(self.list_frame, text="CW (3x20), Exam (100). Double-click for details.")
+        self.list_sub.pack(anchor="w", padx=18, pady=(0, 8))
+
+        # search box - filters the table as you type
+        self.search_bar = tk.Frame(self.list_frame)
+        self.search_bar.pack(fill="x", padx=18)
+        tk.Label(self.search_bar, text="Search:", font=("Segoe UI", 10)).pack(side="left")
+        self.search_var = tk.StringVar(value=self.search_text)
+        self.search_entry = tk.Entry(self.search_bar, textvariable=self.search_var, width=40)
+        self.search_entry.pack(side="left", padx=8)
+        tk.Label(self.search_bar, text="code, name or part of a name - Enter opens the first match, Esc clears",
+                 font=("Segoe UI", 9)).pack(side="left")
+        self.search_var.trace_add("write", lambda *a: self._schedule_search())
+        self.search_entry.bind("<Return>", lambda e: self._open_first_match())
+        self.search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+
+        # filters (see _filter_dialog) and page buttons
+        self.filter_bar = tk.Frame(self.list_frame)
+        self.filter_bar.pack(fill="x", padx=18, pady=(6, 0))
+        ttk.Button(self.filter_bar, text="Filter...", command=self._filter_dialog).pack(side="left")
+        ttk.Button(self.filter_bar, text="Clear", command=self._clear_filters).pack(side="left", padx=(6, 0))
+        self.filter_label = tk.Label(self.filter_bar, text="Showing everyone", font=("Segoe UI", 9))
+        self.filter_label.pack(side="left", padx=8)
+        ttk.Button(self.filter_bar, text="Next page ▶",
+                   command=lambda: self._scroll_rows(self._visible_rows())).pack(side="right")
+        self.page_label = tk.Label(self.filter_bar, font=("Segoe UI", 9))
+        self.page_label.pack(side="right", padx=8)
+        ttk.Button(self.filter_bar, text="◀ Prev page",
+                   command=lambda: self._scroll_rows(-self._visible_rows())).pack(side="right")
 
         # container for the Treeview widget
-        container = tk.Frame(self.main, bg="#111111" if self.current_theme == "dark" else "#eeeeee") 
-        container.pack(fill="both", expand=True, padx=16, pady=12)
+        self.tree_box = tk.Frame(self.list_frame)
+        self.tree_box.pack(fill="both", expand=True, padx=16, pady=12)
 
         cols = ("code", "name", "cw_total", "exam", "pct", "grade")
-        self.tree = ttk.Treeview(container, columns=cols, show="headings", style=self.tree_style)
+        self.tree = ttk.Treeview(self.tree_box, columns=cols, show="headings")
 
         # setup column headers and commands for sorting
         self.tree.heading("code", text="Code", command=lambda: self._sort_by("code"))
@@ -343,11 +923,45 @@ class DarkMarksApp:
         self.tree.column("pct", width=110, anchor="center")
         self.tree.column("grade", width=80, anchor="center")
 
-        # add a scrollbar
-        vs = ttk.Scrollbar(container, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscroll=vs.set)
+        # add a scrollbar - it moves our own window over self.records instead of
+        # scrolling the Treeview, because the Treeview only holds the visible rows
+        self.vscroll = ttk.Scrollbar(self.tree_box, orient="vertical", command=self._on_scrollbar)
         self.tree.pack(side="left", fill="both", expand=True)
-        vs.pack(side="right", fill="y")
+        self.vscroll.pack(side="right", fill="y")
+
+        # mouse wheel (Windows/macOS use <MouseWheel>, Linux uses buttons 4 and 5)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_rows(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_rows(3))
+        self.tree.bind("<Up>", lambda e: self._on_arrow_key(-1))
+        self.tree.bind("<Down>", lambda e: self._on_arrow_key(1))
+        self.tree.bind("<Prior>", lambda e: self._scroll_rows(-self._visible_rows()))
+        self.tree.bind("<Next>", lambda e: self._scroll_rows(self._visible_rows()))
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<ButtonPress-1>", self._note_click, add="+")
+        # redraw when the window is resized so the right number of rows is shown
+        self.tree.bind("<Configure>", lambda e: self._populate_tree())
+        self.tree.bind("<Double-1>", self._on_row_double) # double-click for detail view
+
+        # display a summary of the class average
+        self.summary = tk.Label(self.list_frame, text="Working out the class average...", anchor="w",
+                                font=("Segoe UI", 10))
+        self.summary.pack(fill="x", padx=18, pady=(10, 20))
+        self._style_list_view()
+
+    def _style_list_view(self):
+        # colours for the current theme, changed on the existing widgets
+        self.list_frame.configure(bg=self.main_bg)
+        self.list_hdr.configure(style=self.header_style)
+        self.list_sub.configure(style=self.sub_style)
+        for bar in (self.search_bar, self.filter_bar):
+            bar.configure(bg=self.main_bg)
+            for w in bar.winfo_children():
+                if isinstance(w, tk.Label):
+                    w.configure(bg=self.main_bg, fg=self.status_fg)
+        self.tree_box.configure(bg="#111111" if self.current_theme == "dark" else "#eeeeee")
+        self.tree.configure(style=self.tree_style)
+        self.summary.configure(bg=self.main_bg, fg=self.status_fg)
 
         # alternating row colors and grade-specific colors
         if self.current_theme == "dark":
@@ -364,39 +978,244 @@ class DarkMarksApp:
         self.tree.tag_configure("D", foreground="#cc6600" if self.current_theme == "bright" else "#ffb27a")
         self.tree.tag_configure("F", foreground="#cc0000" if self.current_theme == "bright" else "#ff8a8a")
 
-        self._populate_tree()
-        self.tree.bind("<Double-1>", self._on_row_double) # double-click for detail view
+    def _visible_rows(self):
+        # how many rows fit in the table right now (minus the heading row)
+        height = self.tree.winfo_height()
+        if height <= 1:
+            # not drawn yet, so guess from the Treeview's default height
+            return int(self.tree.cget("height"))
+        return max(1, height // ROW_HEIGHT - 1)
 
-        # display a summary of the class average
-        summary = tk.Label(self.main, text=self._class_summary(), bg=self.main_bg, fg=self.status_fg, anchor="w",
-                             font=("Segoe UI", 10))
-        summary.pack(fill="x", padx=18, pady=(10, 20))
-        self._set_status("Showing all students")
-    
+    @timed("populate")
     def _populate_tree(self):
-        # fill the Treeview with data from self.records
-        if not hasattr(self, "tree"):
+        # only put the rows that are on screen into the Treeview (plus a few extra),
+        # so big files don't have to insert one item per student
+        if not self.list_shown:
+            self.list_stale = True
+            return # hidden, show_list_view fills it when it comes back
+        self.list_stale = False
+        total = self._view_len()
+        visible = self._visible_rows()
+        # keep the window inside the list
+        self.view_top = max(0, min(self.view_top, total - visible))
+        shown = list(self._view_slice(self.view_top, self.view_top + visible + OVERSCAN))
+
+        # add or remove items so there is exactly one per shown row, then refill them
+        slots = self.tree.get_children()
+        for iid in slots[len(shown):]:
+            self.tree.delete(iid)
+        for i in range(len(slots), len(shown)):
+            self.tree.insert("", "end")
+        slots = self.tree.get_children()
+
+        reselect = []
+        for i, (iid, rid) in enumerate(zip(slots, shown)):
+            self._fill_slot(iid, self.view_top + i, rid)
+            if str(self.records.codes[rid]) in self.selected_codes:
+                reselect.append(iid)
+        self.shown = shown
+
+        # the selection belongs to students, not to slots
+        if reselect:
+            self.tree.selection_set(reselect)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+        self._update_scrollbar()
+
+    def _fill_slot(self, iid, pos, rid):
+        # overwrite one item with a student's calculated values and color tags
+        rec = self.records.get(rid)
+        cw = self.records.cw_total(rid)
+        pct = self.records.overall_pct(rid)
+        grd = self.records.grade(rid)
+        # stripe by the real position so colours don't jump while scrolling
+        tag_row = "odd" if pos % 2 == 0 else "even"
+        self.tree.item(iid, values=(rec["code"], rec["name"], cw, rec["exam"], f"{pct}%", grd),
+                       tags=(tag_row, grd))
+
+    def _update_scrollbar(self):
+        # update the scrollbar (and the page buttons' "rows x-y of n") to match the window position
+        total = self._view_len()
+        if total:
+            last = min(total, self.view_top + self._visible_rows())
+            self.vscroll.set(self.view_top / total, last / total)
+            self.page_label.configure(text=f"Rows {self.view_top + 1}-{last} of {total}")
+        else:
+            self.vscroll.set(0, 1)
+            self.page_label.configure(text="No rows")
+
+    # --- Single-row updates: an add/edit/delete only touches the items it has to ---
+    def _row_added(self, rid):
+        if self.filter_rows is not None:
+            self._run_search(keep_place=True) # the new student may or may not match the search
             return
-        # clear existing data
-        for r in self.tree.get_children():
-            self.tree.delete(r)
-        
-        for i, rec in enumerate(self.records):
-            cw = self._cw_total(rec)
-            pct = self._overall_pct(rec)
-            grd = self._grade_from_pct(pct)
-            tag_row = "odd" if i % 2 == 0 else "even"
-            # insert the row with calculated values and color tags
-            self.tree.insert("", "end", values=(rec["code"], rec["name"], cw, rec["exam"], f"{pct}%", grd),
-                             tags=(tag_row, grd))
-
-    def _class_summary(self):
-        # calculate the class average percentage
-        if not self.records:
-            return "No students."
-        total = sum(self._overall_pct(r) for r in self.records)
-        avg = round(total / len(self.records), 2)
-        return f"Students: {len(self.records)}    |    Average %: {avg}"
+        # where the new row landed in the table
+        if self.sort_key is None:
+            pos = len(self.records) - 1
+        else:
+            pos = self.records.sorted_position(self.sort_key, rid)
+            if self.desc_toggle:
+                pos = len(self.records) - 1 - pos
+        if pos < self.view_top or self.list_stale:
+            self._populate_tree() # everything on screen moved down one
+            return
+        at = pos - self.view_top
+        if at < self._visible_rows() + OVERSCAN:
+            iid = self.tree.insert("", at)
+            self._fill_slot(iid, pos, rid)
+            self.shown.insert(at, rid)
+            if len(self.shown) > self._visible_rows() + OVERSCAN:
+                self.tree.delete(self.tree.get_children()[-1])
+                self.shown.pop()
+            self._schedule_restripe()
+        self._update_scrollbar()
+
+    def _row_changed(self, rid):
+        # one student's marks changed
+        if self.filters:
+            self._run_search(keep_place=True) # they may have moved into or out of the filter
+            return
+        if self.sort_key in (None, "code", "name"):
+            # they stay where they are, so only their own row is redrawn (if it's on screen)
+            if rid in self.shown:
+                i = self.shown.index(rid)
+                self._fill_slot(self.tree.get_children()[i], self.view_top + i, rid)
+            return
+        # sorted by a mark, so they may have moved - the sorted index has already
+        # put them in place, search results just need sorting again (they're nearly sorted)
+        if self.filter_rows is not None:
+            self.filter_rows.sort(key=self.records.indexes[self.sort_key].key_of, reverse=self.desc_toggle)
+        self._populate_tree()
+
+    def _row_removed(self, rid):
+        # one student was deleted (they're already gone from the store)
+        if self.filter_rows is not None and rid in self.filter_rows:
+            self.filter_rows.remove(rid)
+        if rid not in self.shown or self.list_stale:
+            self._populate_tree() # not on screen, but the rows above might have shifted
+            return
+        i = self.shown.index(rid)
+        self.tree.delete(self.tree.get_children()[i])
+        del self.shown[i]
+        # the row just below the window moves up into it
+        end = self.view_top + len(self.shown)
+        below = self._view_slice(end, end + 1)
+        if len(below):
+            iid = self.tree.insert("", "end")
+            self._fill_slot(iid, end, below[0])
+            self.shown.append(below[0])
+        elif self.view_top > 0:
+            self._populate_tree() # at the bottom of the list, scroll back one
+            return
+        self._schedule_restripe()
+        self._update_scrollbar()
+
+    def _schedule_restripe(self):
+        # rows below an insert/delete now have the wrong stripe, fix them once things are idle
+        if self.restripe_job is None:
+            self.restripe_job = self.root.after_idle(self._restripe)
+
+    def _restripe(self):
+        self.restripe_job = None
+        for i, (iid, rid) in enumerate(zip(self.tree.get_children(), self.shown)):
+            self.tree.item(iid, tags=("odd" if (self.view_top + i) % 2 == 0 else "even", self.records.grade(rid)))
+
+    def _view_len(self):
+        # how many rows the table has, counting the ones scrolled out of view
+        if self.filter_rows is not None:
+            return len(self.filter_rows)
+        return len(self.records)
+
+    def _view_slice(self, start, stop):
+        # row ids for table positions start..stop, in the current sort order
+        if self.filter_rows is not None:
+            return self.filter_rows[start:stop]
+        if self.sort_key is None:
+            return self.records.order[start:stop]
+        rows = self.records.sorted_rows(self.sort_key)
+        if not self.desc_toggle:
+            return rows[start:stop]
+        # descending is just the ascending index read backwards
+        n = len(rows)
+        return rows[max(0, n - stop):n - start][::-1]
+
+    def _scroll_rows(self, n):
+        # move the visible window by n rows
+        self.view_top += n
+        self._populate_tree()
+        return "break" # stop the Treeview from scrolling by itself
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        # the scrollbar gives us ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if action == "moveto":
+            self.view_top = int(float(amount) * self._view_len())
+            self._populate_tree()
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else 1
+            self._scroll_rows(int(amount) * step)
+
+    def _on_mousewheel(self, event):
+        # Windows sends multiples of 120, macOS sends small numbers
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_rows(-3 * delta)
+
+    def _on_arrow_key(self, step):
+        # scroll the window when the arrow keys go past the top or bottom row
+        sel = self.tree.selection()
+        slots = self.tree.get_children()
+        if not sel or not slots:
+            return
+        pos = slots.index(sel[0]) + step
+        want = self.view_top + pos # the next student's place in the whole table
+        self.extend_select = False
+        if not 0 <= pos < min(len(slots), self._visible_rows()):
+            if not 0 <= want < self._view_len():
+                return "break" # already at the first or last student
+            self._scroll_rows(step)
+            pos = want - self.view_top
+            slots = self.tree.get_children()
+            if not 0 <= pos < len(slots):
+                return "break"
+            # set now as well, the redraw reselects from it before the select event comes
+            self.selected_codes = {str(self.records.codes[self.shown[pos]])}
+        self.tree.selection_set(slots[pos])
+        self.tree.focus(slots[pos])
+        return "break"
+
+    def _note_click(self, event):
+        # a plain click starts a new selection, ctrl/shift-click adds to it
+        self.extend_select = bool(event.state & EXTEND_SELECT_MASK)
+
+    def _on_tree_select(self, event):
+        # Remember which students are selected so scrolling keeps the highlight on
+        # them. The table only holds the rows on screen, so a ctrl/shift-click keeps
+        # the students picked further up or down as well.
+        item = self.tree.item
+        on_screen = {str(item(iid, "values")[0]) for iid in self.tree.get_children()}
+        picked = {str(item(iid, "values")[0]) for iid in self.tree.selection()}
+        if picked == self.selected_codes & on_screen:
+            return # only _populate_tree putting the highlight back after a scroll
+        if self.extend_select:
+            self.selected_codes = (self.selected_codes - on_screen) | picked
+        else:
+            self.selected_codes = picked
+
+    def _refresh_list(self):
+        # redraw the table and the summary after the data changed underneath them
+        if self.search_text or self.filters:
+            self._run_search()
+        else:
+            self._populate_tree()
+        self._refresh_summary()
+
+    @timed("summary")
+    def _refresh_summary(self):
+        # the store keeps the statistics up to date, so this is instant
+        self._show_summary(class_summary(self.records))
+
+    def _show_summary(self, text):
+        if hasattr(self, "summary"):
+            self.summary.configure(text=text)
 
     def _on_row_double(self, event):
         # handler for double-clicking a row
@@ -404,12 +1223,13 @@ class DarkMarksApp:
         if not sel:
             return
         code = self.tree.item(sel[0], "values")[0]
-        rec = self._by_code(code)
-        if rec:
-            self._detail_view(rec)
+        rid = self._by_code(code)
+        if rid is not None:
+            self._detail_view(rid)
 
     # --- Detail / Edit / Delete ---
-    def _detail_view(self, rec):
+    def _detail_view(self, rid):
+        rec = self.records.get(rid)
         self._clear_main()
         hdr = ttk.Label(self.main, text=f"{rec['name']}  ({rec['code']})", style=self.header_style)
         hdr.pack(anchor="w", padx=18, pady=(14, 6))
@@ -431,11 +1251,13 @@ class DarkMarksApp:
 
         # display all the student's details and calculated results
         row("Coursework marks", f"{rec['cw1']}, {rec['cw2']}, {rec['cw3']}")
-        row("Coursework total", f"{self._cw_total(rec)} / 60")
+        row("Coursework total", f"{self.records.cw_total(rid)} / 60")
         row("Exam", f"{rec['exam']} / 100")
-        pct = self._overall_pct(rec)
+        pct = self.records.overall_pct(rid)
         row("Overall %", f"{pct}%")
-        row("Grade", self._grade_from_pct(pct))
+        row("Grade", self.records.grade(rid))
+        row("Rank", f"{self.records.rank(rid)} of {len(self.records)}")
+        row("Percentile", f"better than {self.records.percentile_rank(rid)}% of the class")
 
         # action buttons
         btns = tk.Frame(self.main, bg=self.main_bg)
@@ -448,26 +1270,39 @@ class DarkMarksApp:
         btn_fg = "white"
 
         tk.Button(btns, text="Edit", bg=edit_bg, fg=btn_fg, relief="flat", padx=10, pady=6,
-                     command=lambda: self._open_edit_window(rec)).pack(side="left", padx=6)
+                     command=lambda: self._open_edit_window(rid)).pack(side="left", padx=6)
         tk.Button(btns, text="Delete", bg=delete_bg, fg=btn_fg, relief="flat", padx=10, pady=6,
-                     command=lambda: self._confirm_delete(rec)).pack(side="left", padx=6)
+                     command=lambda: self._confirm_delete(rid)).pack(side="left", padx=6)
         tk.Button(btns, text="Back", bg=back_bg, fg=btn_fg, relief="flat", padx=10, pady=6,
                      command=self.show_list_view).pack(side="left", padx=6)
         self._set_status(f"Viewing {rec['name']}")
 
-    def _confirm_delete(self, rec):
+    def _still_there(self, rid):
+        # a detail view can outlive its student if another program removed them from the file
+        if self.records.names[rid] is not None:
+            return True
+        messagebox.showinfo("Not found", "This student isn't in the file any more.")
+        self.show_list_view()
+        return False
+
+    def _confirm_delete(self, rid):
         # confirmation before deleting a record
+        if not self._check_not_loading():
+            return
+        if not self._still_there(rid):
+            return
+        rec = self.records.get(rid)
         if messagebox.askyesno("Confirm Delete", f"You sure you wanna delete {rec['name']} ({rec['code']})?"):
-            try:
-                self.records.remove(rec)
-                self._save_to_file()
-                self.show_list_view()
+            # by code - the file could have changed while the question was up
+            if self._apply_edits([("-", rec["code"])], f"delete {rec['name']}", "Delete Error"):
+                self.show_list_view(refresh=False)
                 self._set_status(f"Deleted {rec['name']}")
-            except Exception as e:
-                messagebox.showerror("Delete Error", str(e))
 
-    def _open_edit_window(self, rec):
+    def _open_edit_window(self, rid):
         # Toplevel window for editing marks
+        if not self._check_not_loading() or not self._still_there(rid):
+            return
+        rec = self.records.get(rid)
         win = tk.Toplevel(self.root)
         win.title("Edit marks")
         
@@ -495,21 +1330,176 @@ class DarkMarksApp:
                 for v in (c1, c2, c3):
                     if not (0 <= v <= 20): raise ValueError("Coursework has to be between 0 and 20!")
                 if not (0 <= ex <= 100): raise ValueError("Exam has to be between 0 and 100!")
-                    
-                # update the record and save
-                rec["cw1"], rec["cw2"], rec["cw3"], rec["exam"] = c1, c2, c3, ex
-                self._save_to_file()
-                win.destroy()
-                self.show_list_view()
-                self._set_status(f"Updated {rec['name']}")
             except ValueError as ve:
                 messagebox.showerror("Invalid", str(ve))
+                return
+            # update the record and save (by code - another program could have removed them)
+            if self._apply_edits([("=", rec["code"], c1, c2, c3, ex)], f"edit {rec['name']}", "Invalid"):
+                win.destroy()
+                self.show_list_view(refresh=False)
+                self._set_status(f"Updated {rec['name']}")
 
         tk.Button(win, text="Save", bg=btn_bg, fg="white", command=apply, padx=10, pady=6).grid(row=len(fields), column=0, columnspan=2, pady=10)
 
+    # --- Undo/redo and changes to many students at once ---
+    # Every add, edit and delete goes through the edit log (see EditLog), so each one
+    # is a single undo step with one save and one redraw, however many students it touches.
+    def _apply_edits(self, changes, label, error_title="Edit Error"):
+        # returns True if the changes went in, shows what was wrong otherwise
+        if not self._check_not_loading():
+            return False
+        try:
+            step = self.history.apply(changes, label)
+        except ValueError as e:
+            messagebox.showerror(error_title, str(e))
+            return False
+        self._after_edits(*step)
+        return True
+
+    @timed("edit")
+    def _after_edits(self, label, changes, rids):
+        self._record_changes(changes)
+        self._update_undo_menu()
+        if len(changes) == 1:
+            # one student - only their row needs redrawing
+            redraw = {"+": self._row_added, "=": self._row_changed, "-": self._row_removed}
+            redraw[changes[0][0]](rids[0])
+            self._refresh_summary()
+        else:
+            self._refresh_list()
+
+    def _undo(self):
+        self._step_history(self.history.undo, "Undid")
+
+    def _redo(self):
+        self._step_history(self.history.redo, "Redid")
+
+    def _step_history(self, step, verb):
+        if isinstance(self.root.focus_get(), tk.Entry):
+            return # Ctrl+Z while typing is about the text, not the students
+        if not self._check_not_loading():
+            return
+        try:
+            done = step()
+        except ValueError as e:
+            # can't happen unless something skipped the log, so start afresh
+            self.history.clear()
+            self._update_undo_menu()
+            messagebox.showerror("Undo Error", f"Couldn't do that:\n{e}")
+            return
+        if done is None:
+            self._set_status("Nothing to undo." if verb == "Undid" else "Nothing to redo.")
+            return
+        self._after_edits(*done)
+        if not self.list_shown:
+            self.show_list_view(refresh=False) # a detail view could be showing a student that just went
+        self._set_status(f"{verb} {done[0]}")
+
+    def _update_undo_menu(self):
+        # "Undo edit Jo Smith" etc., greyed out when there's nothing to do
+        for i, (word, steps) in enumerate((("Undo", self.history.undo_steps), ("Redo", self.history.redo_steps))):
+            if steps:
+                self.edit_menu.entryconfigure(i, label=f"{word} {steps[-1][0]}", state="normal")
+            else:
+                self.edit_menu.entryconfigure(i, label=word, state="disabled")
+
+    def _delete_many(self, rids):
+        # delete a batch of students as one change (selected rows or search results)
+        if not self._check_not_loading():
+            return
+        if not rids:
+            messagebox.showinfo("Select", "Select some rows or search for the students first.")
+            return
+        names = [f"{self.records.names[rid]} ({self.records.codes[rid]})" for rid in rids[:CONFIRM_NAMES]]
+        if len(rids) > CONFIRM_NAMES:
+            names.append(f"...and {len(rids) - CONFIRM_NAMES} more")
+        if not messagebox.askyesno("Confirm Delete", f"You sure you wanna delete these {len(rids)} students?\n\n"
+                                   + "\n".join(names)):
+            return
+        codes = [self.records.codes[rid] for rid in rids if self.records.names[rid] is not None]
+        if self._apply_edits([("-", code) for code in codes], f"delete {len(codes)} students", "Delete Error"):
+            self.selected_codes = set()
+            self.show_list_view(refresh=False)
+            self._set_status(f"Deleted {len(codes)} students")
+
+    def _edit_many(self, rids):
+        # Change the marks of a batch of students in one go. Each box can be left
+        # empty (keep everyone's mark), a number (give everyone that mark) or +n/-n
+        # (move everyone's mark by n, kept inside the allowed range).
+        if not self._check_not_loading():
+            return
+        if not rids:
+            messagebox.showinfo("Select", "Select some rows or search for the students first.")
+            return
+        rids = list(rids) # search results can change while the window is open
+        win = tk.Toplevel(self.root)
+        win.title(f"Edit marks of {len(rids)} students")
+
+        win_bg = "#061328" if self.current_theme == "dark" else "#f8f9fa"
+        win_fg = "#dff1ff" if self.current_theme == "dark" else "#343a40"
+        btn_bg = "#1b7ca6" if self.current_theme == "dark" else "#28a745"
+
+        win.configure(bg=win_bg)
+        tk.Label(win, text=f"{len(rids)} students - leave a box empty to keep their marks,\n"
+                           "type a number to set it, or +n / -n to change it by n",
+                 bg=win_bg, fg=win_fg, justify="left").grid(row=0, column=0, columnspan=2, sticky="w", padx=10, pady=(10, 4))
+        fields = [("Coursework 1", "cw1", 20), ("Coursework 2", "cw2", 20), ("Coursework 3", "cw3", 20),
+                  ("Exam", "exam", 100)]
+        entries = {}
+        for i, (lab, key, _) in enumerate(fields, start=1):
+            tk.Label(win, text=lab + ":", bg=win_bg, fg=win_fg).grid(row=i, column=0, sticky="w", padx=10, pady=6)
+            e = tk.Entry(win)
+            e.grid(row=i, column=1, padx=10, pady=6, sticky="ew")
+            entries[key] = e
+        win.grid_columnconfigure(1, weight=1)
+
+        def apply():
+            # work out everyone's new marks, then change them all as one undo step
+            rules = []
+            for lab, key, top in fields:
+                text = entries[key].get().strip()
+                if not text:
+                    continue
+                relative = text[0] in "+-"
+                try:
+                    n = int(text)
+                except ValueError:
+                    messagebox.showerror("Invalid", f"{lab} has to be a whole number!")
+                    return
+                if not relative and not (0 <= n <= top):
+                    messagebox.showerror("Invalid", f"{lab} has to be between 0 and {top}!")
+                    return
+                rules.append((key, top, relative, n))
+            if not rules:
+                win.destroy()
+                return
+            changes = []
+            for rid in rids:
+                if self.records.names[rid] is None:
+                    continue # deleted since the window opened
+                marks = {"cw1": self.records.cw1[rid], "cw2": self.records.cw2[rid],
+                         "cw3": self.records.cw3[rid], "exam": self.records.exam[rid]}
+                old = tuple(marks.values())
+                for key, top, relative, n in rules:
+                    marks[key] = min(top, max(0, marks[key] + n)) if relative else n
+                if tuple(marks.values()) != old:
+                    changes.append(("=", self.records.codes[rid], *marks.values()))
+            win.destroy()
+            if not changes:
+                self._set_status("Nothing to change")
+                return
+            if self._apply_edits(changes, f"edit {len(changes)} students", "Invalid"):
+                self.show_list_view(refresh=False)
+                self._set_status(f"Updated {len(changes)} students")
+
+        tk.Button(win, text="Save", bg=btn_bg, fg="white", command=apply, padx=10, pady=6).grid(
+            row=len(fields) + 1, column=0, columnspan=2, pady=10)
+
     # --- Add / Find / Sort ---
     def _add_view(self):
         # screen for adding a new student record
+        if not self._check_not_loading():
+            return
         self._clear_main()
         ttk.Label(self.main, text="Add Student", style=self.header_style).pack(anchor="w", padx=18, pady=(14, 6))
         
@@ -547,101 +1537,386 @@ class DarkMarksApp:
                 if not (0 <= ex <= 100): raise ValueError("Exam must be 0-100")
                 
                 # check for duplicate student code
-                if any(r["code"] == code for r in self.records):
+                if self._by_code(code) is not None:
                     raise ValueError("A student with this code already exists")
-                    
-                # create, add, and save the new record
-                rec = {"code": code, "name": name, "cw1": cw1, "cw2": cw2, "cw3": cw3, "exam": ex}
-                self.records.append(rec)
-                self._save_to_file()
-                self.show_list_view()
-                self._set_status(f"Added {name}")
             except ValueError as ve:
                 messagebox.showerror("Invalid input", str(ve))
+                return
+            # create, add, and save the new record
+            if self._apply_edits([("+", int(code), name, cw1, cw2, cw3, ex)], f"add {name}", "Invalid input"):
+                self.show_list_view(refresh=False)
+                self._set_status(f"Added {name}")
 
         tk.Button(self.main, text="Create", bg=btn_bg, fg="white", command=save_new, padx=12, pady=8).pack(anchor="e", padx=18, pady=(6, 12))
 
     def _by_code(self, code):
-        # find a record by student code
-        for r in self.records:
-            if str(r["code"]) == str(code):
-                return r
-        return None
+        # find a record's row id by student code
+        return self.records.find(code)
 
     def _edit_selected(self):
         # wrapper to open edit window for the selected row
         if not hasattr(self, "tree"):
             messagebox.showinfo("Select", "Open the list view and select a row to edit.")
             return
-        sel = self.tree.selection()
-        if not sel:
-            messagebox.showinfo("Select", "Gotta select a row first!")
-            return
-        code = self.tree.item(sel[0], "values")[0]
-        rec = self._by_code(code)
-        if rec:
-            self._open_edit_window(rec)
+        rids = self._selected_rows()
+        if len(rids) == 1:
+            self._open_edit_window(rids[0])
+        elif rids:
+            self._edit_many(rids)
 
     def _delete_selected(self):
         # wrapper to confirm and delete the selected row
         if not hasattr(self, "tree"):
             messagebox.showinfo("Select", "Open the list view and select a row to delete.")
             return
-        sel = self.tree.selection()
-        if not sel:
+        rids = self._selected_rows()
+        if len(rids) == 1:
+            self._confirm_delete(rids[0])
+        elif rids:
+            self._delete_many(rids)
+
+    def _selected_rows(self):
+        # row ids of the selected students (ctrl/shift-click picks more than one),
+        # including ones scrolled out of view but not ones a search or filter hides
+        rids = (self._by_code(code) for code in self.selected_codes)
+        rids = sorted(rid for rid in rids if rid is not None)
+        if self.filter_rows is not None:
+            in_view = set(self.filter_rows)
+            rids = [rid for rid in rids if rid in in_view]
+        if not rids:
             messagebox.showinfo("Select", "Gotta select a row first!")
+        return rids
+
+    def _filter_dialog(self):
+        # pick which students the table shows: grades, ranges of marks and the start of
+        # the name - they're looked up with MarkStore.query, so big classes stay quick
+        if not self._check_not_loading():
             return
-        code = self.tree.item(sel[0], "values")[0]
-        rec = self._by_code(code)
-        if rec:
-            self._confirm_delete(rec)
+        win = tk.Toplevel(self.root)
+        win.title("Filter students")
+
+        win_bg = "#081a2a" if self.current_theme == "dark" else "#f8f9fa"
+        win_fg = "#dff1ff" if self.current_theme == "dark" else "#343a40"
+        btn_bg = "#1b7ca6" if self.current_theme == "dark" else "#007bff"
+        win.configure(bg=win_bg)
+
+        tk.Label(win, text="Grades:", bg=win_bg, fg=win_fg).grid(row=0, column=0, sticky="w", padx=10, pady=6)
+        grade_box = tk.Frame(win, bg=win_bg)
+        grade_box.grid(row=0, column=1, columnspan=3, sticky="w", padx=10)
+        chosen = self.filters.get("grades", "")
+        grade_vars = {}
+        for g in "ABCDF":
+            grade_vars[g] = tk.BooleanVar(value=g in chosen)
+            tk.Checkbutton(grade_box, text=g, variable=grade_vars[g], bg=win_bg, fg=win_fg,
+                           selectcolor=win_bg).pack(side="left")
+
+        # (label, query argument, whole numbers only) - each gets a from and a to box
+        ranges = [("Overall %", "pct", False), ("Exam", "exam", True), ("Coursework total", "cw_total", True)]
+        boxes = {}
+        for i, (lab, key, _) in enumerate(ranges, start=1):
+            tk.Label(win, text=lab + " from:", bg=win_bg, fg=win_fg).grid(row=i, column=0, sticky="w", padx=10, pady=6)
+            low, high = tk.Entry(win, width=8), tk.Entry(win, width=8)
+            low.grid(row=i, column=1, padx=(10, 4))
+            tk.Label(win, text="to", bg=win_bg, fg=win_fg).grid(row=i, column=2)
+            high.grid(row=i, column=3, padx=(4, 10))
+            for entry, value in zip((low, high), self.filters.get(key, (None, None))):
+                if value is not None:
+                    entry.insert(0, str(value))
+            boxes[key] = (low, high)
+        row = len(ranges) + 1
+        tk.Label(win, text="Name starts with:", bg=win_bg, fg=win_fg).grid(row=row, column=0, sticky="w", padx=10, pady=6)
+        name_entry = tk.Entry(win)
+        name_entry.grid(row=row, column=1, columnspan=3, sticky="ew", padx=10)
+        name_entry.insert(0, self.filters.get("name", ""))
+
+        def apply_filter():
+            filters = {}
+            grades = "".join(g for g, var in grade_vars.items() if var.get())
+            if grades:
+                filters["grades"] = grades
+            for lab, key, whole in ranges:
+                bounds = []
+                for entry in boxes[key]:
+                    text = entry.get().strip()
+                    try:
+                        bounds.append(None if not text else int(text) if whole else float(text))
+                    except ValueError:
+                        messagebox.showerror("Invalid", f"{lab} has to be a {'whole ' if whole else ''}number!")
+                        return
+                if bounds != [None, None]:
+                    filters[key] = tuple(bounds)
+            name = name_entry.get().strip()
+            if name:
+                filters["name"] = name
+            win.destroy()
+            self._set_filters(filters)
+
+        tk.Button(win, text="Apply", bg=btn_bg, fg="white", command=apply_filter).grid(
+            row=row + 1, column=0, columnspan=4, pady=10)
+
+    def _set_filters(self, filters):
+        self.filters = filters
+        parts = []
+        if "grades" in filters:
+            parts.append(f"grade {', '.join(filters['grades'])}")
+        for key, lab in (("pct", "overall %"), ("exam", "exam"), ("cw_total", "coursework")):
+            if key in filters:
+                low, high = filters[key]
+                parts.append(f"{lab} {'' if low is None else low}-{'' if high is None else high}")
+        if "name" in filters:
+            parts.append(f"name starts \"{filters['name']}\"")
+        self.filter_label.configure(text="Filter: " + "; ".join(parts) if parts else "Showing everyone")
+        if not self.list_shown:
+            self.show_list_view(refresh=False)
+        self._run_search()
+
+    def _clear_filters(self):
+        self._set_filters({})
 
     def _search_dialog(self):
-        # search by code or name
+        # search by code or name - jumps to the search box above the table
         if not self.records:
             messagebox.showinfo("No data", "No students to search through.")
             return
-        q = simpledialog.askstring("Search", "Enter student code or full name:")
-        if not q:
-            return
-        q = q.strip()
-        # check code match
-        rec = self._by_code(q)
-        if rec:
-            self._detail_view(rec); return
-        # check exact name match
-        for r in self.records:
-            if r["name"].lower() == q.lower():
-                self._detail_view(r); return
-        # check partial name match
-        matches = [r for r in self.records if q.lower() in r["name"].lower()]
-        if not matches:
+        if not self.list_shown:
+            self.show_list_view()
+        self.search_entry.focus_set()
+        self.search_entry.select_range(0, "end")
+
+    def _schedule_search(self):
+        # wait for a short pause in typing so we don't search on every key
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self._run_search)
+
+    @timed("search")
+    def _run_search(self, keep_place=False):
+        # filter the table down to the matching students, best matches first.
+        # keep_place stays scrolled where it was (after a single add or edit, the
+        # redraw pulls it back if the list got shorter), otherwise it's back to the top
+        self.search_job = None
+        self.search_text = self.search_var.get().strip()
+        if not keep_place:
+            self.view_top = 0
+        if self.filters:
+            # the query hands them back in the table's order already
+            _, rows = self.records.query(**self.filters, order_by=self.sort_key, desc=self.desc_toggle)
+            if self.search_text:
+                hits = set(self.records.search(self.search_text))
+                rows = [rid for rid in rows if rid in hits]
+            self.filter_rows = rows
+            self._populate_tree()
+            self._set_status(f"{len(rows)} students match the filter"
+                             + (f" and \"{self.search_text}\"" if self.search_text else ""))
+            return
+        if not self.search_text:
+            self.filter_rows = None
+            self._populate_tree()
+            self._set_status("Showing all students")
+            return
+        self.filter_rows = self.records.search(self.search_text)
+        if self.sort_key is not None:
+            # keep the column sort the user picked
+            self.filter_rows.sort(key=self.records.indexes[self.sort_key].key_of, reverse=self.desc_toggle)
+        self._populate_tree()
+        self._set_status(f"{len(self.filter_rows)} students match \"{self.search_text}\"")
+
+    def _open_first_match(self):
+        if self.search_job:
+            self._run_search() # Enter pressed before the search ran
+        if self.filter_rows:
+            self._detail_view(self.filter_rows[0])
+        elif self.filter_rows is not None:
             messagebox.showinfo("Not found", "Nobody matched that query.")
-        elif len(matches) == 1:
-            self._detail_view(matches[0])
-        else:
-            # show multiple matches if more than one found
-            msg = "\n".join(f"{m['name']} ({m['code']})" for m in matches)
-            messagebox.showinfo("Multiple matches", msg)
 
     def _show_extreme_max(self):
         # find and show the student with the highest overall percentage
         if not self.records:
             messagebox.showinfo("No data", "No students available.")
             return
-        rec = max(self.records, key=self._overall_pct)
-        self._detail_view(rec)
+        self._detail_view(self.records.best())
 
     def _show_extreme_min(self):
         # find and show the student with the lowest overall percentage
         if not self.records:
             messagebox.showinfo("No data", "No students available.")
             return
-        rec = min(self.records, key=self._overall_pct)
-        self._detail_view(rec)
+        self._detail_view(self.records.worst())
+
+    def _stats_view(self):
+        # class statistics panel - everything here is kept up to date by the store
+        if not self.records:
+            messagebox.showinfo("No data", "No students available.")
+            return
+        self._clear_main()
+        ttk.Label(self.main, text="Class Statistics", style=self.header_style).pack(anchor="w", padx=18, pady=(14, 6))
+
+        frame_bg = "#08182a" if self.current_theme == "dark" else "#e9e9e9"
+        text_fg = "#dff1ff" if self.current_theme == "dark" else "#000000"
+        value_fg = "#cfe8ff" if self.current_theme == "dark" else "#333333"
+        bar_bg = "#1b7ca6" if self.current_theme == "dark" else "#007bff"
+
+        frame = tk.Frame(self.main, bg=frame_bg, padx=16, pady=16)
+        frame.pack(fill="x", padx=18, pady=12)
+
+        def row(label, value):
+            # helper to create a label: value row
+            r = tk.Frame(frame, bg=frame_bg)
+            r.pack(anchor="w", pady=6, fill="x")
+            tk.Label(r, text=f"{label}:", bg=frame_bg, fg=text_fg, font=("Segoe UI", 10, "bold")).pack(side="left")
+            tk.Label(r, text=value, bg=frame_bg, fg=value_fg, font=("Segoe UI", 10)).pack(side="left", padx=8)
+
+        best, worst = self.records.best(), self.records.worst()
+        row("Students", len(self.records))
+        row("Average %", f"{self.records.average_pct()}%")
+        row("Median %", f"{self.records.median()}%")
+        row("Highest", f"{self.records.names[best]} ({self.records.codes[best]}) - {self.records.pct[best]}%")
+        row("Lowest", f"{self.records.names[worst]} ({self.records.codes[worst]}) - {self.records.pct[worst]}%")
+
+        # a little bar chart of how many students got each grade
+        chart = tk.Canvas(frame, bg=frame_bg, height=5 * 28, highlightthickness=0)
+        chart.pack(anchor="w", fill="x", pady=(12, 0))
+        most = max(self.records.grade_counts.values()) or 1
+        for i, (g, n) in enumerate(self.records.grade_counts.items()):
+            y = i * 28
+            chart.create_text(10, y + 12, text=g, fill=text_fg, font=("Segoe UI", 10, "bold"))
+            chart.create_rectangle(30, y + 4, 30 + 400 * n / most, y + 20, fill=bar_bg, outline="")
+            chart.create_text(40 + 400 * n / most, y + 12, text=str(n), fill=value_fg, anchor="w")
+
+        tk.Button(self.main, text="Back", bg="#334c63" if self.current_theme == "dark" else "#6c757d", fg="white",
+                  relief="flat", padx=10, pady=6, command=self.show_list_view).pack(anchor="w", padx=24, pady=(6, 12))
+        self._set_status("Showing class statistics")
+
+    def _rankings_view(self, n=RANKINGS_N):
+        # the best and worst n students side by side, with the median and quartiles -
+        # all read off the sorted percentage index, so it's quick however big the class is
+        if not self.records:
+            messagebox.showinfo("No data", "No students available.")
+            return
+        self._clear_main()
+        ttk.Label(self.main, text="Rankings", style=self.header_style).pack(anchor="w", padx=18, pady=(14, 6))
+
+        frame_bg = "#08182a" if self.current_theme == "dark" else "#e9e9e9"
+        text_fg = "#dff1ff" if self.current_theme == "dark" else "#000000"
+        value_fg = "#cfe8ff" if self.current_theme == "dark" else "#333333"
+
+        frame = tk.Frame(self.main, bg=frame_bg, padx=16, pady=12)
+        frame.pack(fill="x", padx=18, pady=(6, 12))
+        for label, p in (("Lower quartile", 25), ("Median", 50), ("Upper quartile", 75), ("Top 10% from", 90)):
+            tk.Label(frame, text=f"{label}:", bg=frame_bg, fg=text_fg, font=("Segoe UI", 10, "bold")).pack(side="left")
+            tk.Label(frame, text=f"{self.records.percentile(p)}%", bg=frame_bg, fg=value_fg,
+                     font=("Segoe UI", 10)).pack(side="left", padx=(6, 18))
+
+        # how many to show
+        bar = tk.Frame(self.main, bg=self.main_bg)
+        bar.pack(fill="x", padx=18)
+        tk.Label(bar, text="Show the top and bottom", bg=self.main_bg, fg=self.status_fg).pack(side="left")
+        count = tk.Entry(bar, width=6)
+        count.insert(0, str(n))
+        count.pack(side="left", padx=6)
+
+        def show():
+            try:
+                want = int(count.get())
+                if not 1 <= want <= RANKINGS_MAX:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Invalid", f"Pick a number from 1 to {RANKINGS_MAX}.")
+                return
+            self._rankings_view(want)
+        count.bind("<Return>", lambda e: show())
+        ttk.Button(bar, text="Show", command=show).pack(side="left")
+
+        tables = tk.Frame(self.main, bg=self.main_bg)
+        tables.pack(fill="both", expand=True, padx=16, pady=(8, 6))
+        for title, rows in ((f"Top {n}", self.records.top(n)), (f"Bottom {n}", self.records.top(n, lowest=True))):
+            box = tk.Frame(tables, bg=self.main_bg)
+            box.pack(side="left", fill="both", expand=True, padx=2)
+            tk.Label(box, text=title, bg=self.main_bg, fg=text_fg, font=("Segoe UI", 10, "bold")).pack(anchor="w")
+            cols = ("rank", "code", "name", "pct")
+            tree = ttk.Treeview(box, columns=cols, show="headings", style=self.tree_style)
+            for col, text, width in zip(cols, ("Rank", "Code", "Name", "Overall %"), (60, 70, 180, 90)):
+                tree.heading(col, text=text)
+                tree.column(col, width=width, anchor="w" if col == "name" else "center")
+            scroll = ttk.Scrollbar(box, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scroll.set)
+            tree.pack(side="left", fill="both", expand=True)
+            scroll.pack(side="right", fill="y")
+            for rid in rows:
+                tree.insert("", "end", iid=str(rid), values=(self.records.rank(rid), self.records.codes[rid],
+                                                             self.records.names[rid], f"{self.records.pct[rid]}%"))
+            tree.bind("<Double-1>", lambda e, tree=tree: self._open_ranked(tree))
+
+        tk.Button(self.main, text="Back", bg="#334c63" if self.current_theme == "dark" else "#6c757d", fg="white",
+                  relief="flat", padx=10, pady=6, command=self.show_list_view).pack(anchor="w", padx=24, pady=(6, 12))
+        self._set_status(f"Showing the top and bottom {n} of {len(self.records)} students")
+
+    def _open_ranked(self, tree):
+        # double-click in the Rankings view - the item ids are row ids
+        sel = tree.selection()
+        if sel and self._still_there(int(sel[0])):
+            self._detail_view(int(sel[0]))
+
+    def _cohort_dialog(self):
+        # File > Cohort statistics: read every marks file in a folder (one per module)
+        # on all the cores and show them merged by student code. The open file isn't touched.
+        folder = filedialog.askdirectory(title="Folder of module marks files")
+        if not folder:
+            return
+        paths = cohort_files(folder)
+        if not paths:
+            messagebox.showinfo("No data", "There are no marks files in that folder.")
+            return
+        self._set_status(f"Reading {len(paths)} module files...")
+        self.tasks.submit(load_cohort, paths, on_done=self._cohort_view,
+                          on_error=lambda e: messagebox.showerror("Load Error", f"Couldn't read the folder:\n{e}"),
+                          key="cohort")
+
+    def _cohort_view(self, cohort):
+        # cross-module statistics plus a table of the modules
+        self._clear_main()
+        ttk.Label(self.main, text="Cohort Statistics", style=self.header_style).pack(anchor="w", padx=18, pady=(14, 6))
+
+        frame_bg = "#08182a" if self.current_theme == "dark" else "#e9e9e9"
+        text_fg = "#dff1ff" if self.current_theme == "dark" else "#000000"
+        value_fg = "#cfe8ff" if self.current_theme == "dark" else "#333333"
+
+        frame = tk.Frame(self.main, bg=frame_bg, padx=16, pady=16)
+        frame.pack(fill="x", padx=18, pady=12)
+        for label, value in cohort.summary():
+            r = tk.Frame(frame, bg=frame_bg)
+            r.pack(anchor="w", pady=3, fill="x")
+            tk.Label(r, text=f"{label}:", bg=frame_bg, fg=text_fg, font=("Segoe UI", 10, "bold")).pack(side="left")
+            tk.Label(r, text=value, bg=frame_bg, fg=value_fg, font=("Segoe UI", 10)).pack(side="left", padx=8)
+        for name, error in cohort.failed:
+            tk.Label(frame, text=f"Couldn't read {name}: {error}", bg=frame_bg, fg="#ff6b6b",
+                     font=("Segoe UI", 9)).pack(anchor="w")
+
+        # one row per module - there are only ever a few hundred, so no windowing needed
+        container = tk.Frame(self.main, bg="#111111" if self.current_theme == "dark" else "#eeeeee")
+        container.pack(fill="both", expand=True, padx=16, pady=(0, 6))
+        cols = ("module", "students", "avg", "A", "B", "C", "D", "F")
+        tree = ttk.Treeview(container, columns=cols, show="headings", style=self.tree_style)
+        for col, text, width in zip(cols, ("Module", "Students", "Average %", "A", "B", "C", "D", "F"),
+                                    (220, 90, 100, 60, 60, 60, 60, 60)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor="w" if col == "module" else "center")
+        scroll = ttk.Scrollbar(container, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+        for name, n, avg, grades, bad in cohort.modules:
+            tree.insert("", "end", values=(name, n, "-" if avg is None else f"{avg}%",
+                                           *(grades[g] for g in "ABCDF")))
+
+        tk.Button(self.main, text="Back", bg="#334c63" if self.current_theme == "dark" else "#6c757d", fg="white",
+                  relief="flat", padx=10, pady=6, command=self.show_list_view).pack(anchor="w", padx=24, pady=(6, 12))
+        self._set_status(f"Showing {len(cohort.modules)} modules, {len(cohort)} students")
 
     def _sort_dialog(self):
         # dialogue window to sort by percentage (asc/desc)
+        if not self._check_not_loading():
+            return
         if not self.records:
             messagebox.showinfo("No data", "No students to sort.")
             return
@@ -660,10 +1935,9 @@ class DarkMarksApp:
         tk.Radiobutton(win, text="Descending", variable=var, value="desc", bg=win_bg, fg=radio_fg).pack(anchor="w", padx=12)
 
         def apply_sort():
-            # sort the list and update the display
-            reverse = (var.get() == "desc")
-            self.records.sort(key=self._overall_pct, reverse=reverse)
-            self._save_to_file()
+            # show the list sorted by percentage - the data and the file stay as they are
+            self.sort_key = "pct"
+            self.desc_toggle = (var.get() == "desc")
             self.show_list_view()
             win.destroy()
             self._set_status("Sorted records")
@@ -671,33 +1945,25 @@ class DarkMarksApp:
         tk.Button(win, text="Apply", bg=btn_bg, fg="white", command=apply_sort).pack(pady=10, padx=12)
 
     # --- Utility Functions (for column header sorting) ---
+    @timed("sort")
     def _sort_by(self, key):
         # dynamic sorting function for Treeview column headers
         if not self.records:
             return
-        # select the correct function to get the value for sorting
-        if key == "code":
-            func = lambda r: int(r["code"])
-        elif key == "name":
-            func = lambda r: r["name"].lower()
-        elif key == "cw_total":
-            func = lambda r: self._cw_total(r)
-        elif key == "exam":
-            func = lambda r: r["exam"]
-        elif key == "pct":
-            func = lambda r: self._overall_pct(r)
-        elif key == "grade":
-            # sort by grade (A, B, C...)
-            func = lambda r: self._grade_from_pct(self._overall_pct(r))
-        else:
+        if key not in ("code", "name", "cw_total", "exam", "pct", "grade"):
             return
-            
-        # toggle between ascending and descending
+
+        if not self._check_not_loading():
+            return
+
+        # toggle between ascending and descending, just by reading the column's index
+        # forwards or backwards - nothing gets re-sorted or saved
         self.desc_toggle = not getattr(self, "desc_toggle", False)
-        self.records.sort(key=func, reverse=self.desc_toggle)
-        
-        if hasattr(self, "tree"):
-            self._populate_tree()
+        self.sort_key = key
+        if self.filter_rows is not None:
+            # search results aren't in an index, so just sort those few rows
+            self.filter_rows.sort(key=self.records.indexes[key].key_of, reverse=self.desc_toggle)
+        self._populate_tree()
         self._set_status(f"Sorted by {key} ({'desc' if self.desc_toggle else 'asc'})")
 
 # --- Main Execution ---